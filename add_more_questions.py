@@ -1,9 +1,12 @@
 import os
-from database import import_questions_from_txt, get_all_categories, get_all_questions
+from database import ensure_schema, import_questions_from_txt, get_all_categories, get_all_questions
 
 def add_new_questions():
     print("开始添加新题目到数据库...")
     
+    # 先建表并执行迁移，未初始化或旧版本的数据库也能直接导入
+    ensure_schema()
+    
     # 获取当前所有题目数量作为参考
     initial_count = len(get_all_questions())
     print(f"当前题库共有 {initial_count} 道题目")
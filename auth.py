@@ -1,10 +1,19 @@
 import streamlit as st
 import database as db
-import json
-import os
+import atexit
+import hashlib
+import secrets
+from http.cookies import SimpleCookie
+from utils.session_store import SessionStore, SESSION_TTL
 
-# 保存会话状态的文件路径
-SESSION_FILE = '.session_state.json'
+# 会话令牌保存在 Cookie 中（不放进 URL，避免随链接、历史记录和日志泄露），刷新页面后凭它恢复登录状态
+SESSION_COOKIE = 'exam_sid'
+# 旧版本放令牌的 URL 参数，只用于把它从地址栏清掉
+SESSION_PARAM = 'sid'
+
+# 服务端会话存储：内存读写，后台合并写入数据库
+_sessions = SessionStore()
+atexit.register(_sessions.close)
 
 def init_auth():
     """初始化认证状态，并尝试从文件恢复会话状态"""
@@ -16,9 +25,14 @@ def init_auth():
         st.session_state.username = None
     if 'is_admin' not in st.session_state:
         st.session_state.is_admin = False
-        
-    # 尝试从文件恢复会话状态
-    load_session_state()
+    
+    # 每个浏览器会话只在第一次运行时按令牌恢复状态
+    if 'session_token' not in st.session_state:
+        if SESSION_PARAM in st.query_params:
+            del st.query_params[SESSION_PARAM]
+        st.session_state.session_token = _cookie_token()
+        load_session_state()
+    _sync_session_cookie()
 
 def login(username, password):
     """用户登录，验证成功后保存状态"""
@@ -29,6 +43,8 @@ def login(username, password):
         st.session_state.username = user['username']
         st.session_state.is_admin = bool(user['is_admin'])
         
+        # 登录时换发新令牌，避免沿用别人给的链接里的令牌
+        _new_session_token()
         # 登录成功后保存会话状态
         save_session_state()
         return True
@@ -42,8 +58,10 @@ def logout():
     st.session_state.is_admin = False
     
     # 清除保存的会话状态
-    if os.path.exists(SESSION_FILE):
-        os.remove(SESSION_FILE)
+    token = st.session_state.get('session_token')
+    if token:
+        _sessions.delete(token)
+    st.session_state.session_token = None
 
 def is_logged_in():
     """检查用户是否已登录"""
@@ -92,42 +110,99 @@ def admin_required(func):
         return func(*args, **kwargs)
     return wrapper
 
+def _request_headers():
+    """当前页面连接的请求头；不在 Streamlit 服务中运行时为空"""
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+        return _get_websocket_headers() or {}
+    except Exception:
+        return {}
+
+def _cookie_token():
+    """浏览器随连接带来的会话令牌"""
+    cookie = SimpleCookie()
+    try:
+        cookie.load(_request_headers().get('Cookie', ''))
+    except Exception:
+        return None
+    morsel = cookie.get(SESSION_COOKIE)
+    return morsel.value if morsel else None
+
+def _client_fingerprint():
+    """令牌绑定的客户端特征：换了浏览器拿到令牌也无法恢复会话"""
+    user_agent = _request_headers().get('User-Agent', '')
+    return hashlib.sha256(user_agent.encode('utf-8')).hexdigest()[:32]
+
+def _sync_session_cookie():
+    """让浏览器的 Cookie 跟当前令牌一致；内容不变时前端复用同一个组件，不会重复执行"""
+    import streamlit.components.v1 as components
+    token = st.session_state.get('session_token')
+    if token:
+        cookie = f"{SESSION_COOKIE}={token}; path=/; max-age={SESSION_TTL}; SameSite=Strict"
+    else:
+        cookie = f"{SESSION_COOKIE}=; path=/; max-age=0; SameSite=Strict"
+    components.html(
+        f"""<script>
+        var cookie = "{cookie}";
+        if (window.parent.location.protocol === "https:") {{ cookie += "; Secure"; }}
+        window.parent.document.cookie = cookie;
+        </script>""",
+        height=0,
+    )
+
+def _new_session_token():
+    token = secrets.token_urlsafe(24)
+    st.session_state.session_token = token
+    return token
+
 def save_session_state():
-    """保存会话状态到文件"""
+    """保存会话状态到服务端会话存储（未变化时不会重复写入）"""
+    token = st.session_state.get('session_token')
+    if not token:
+        return
     session_data = {
         'logged_in': st.session_state.logged_in,
         'user_id': st.session_state.user_id,
         'username': st.session_state.username,
         'is_admin': st.session_state.is_admin,
-        'page': st.session_state.get('page', 'login')
+        'page': st.session_state.get('page', 'login'),
+        'client': _client_fingerprint()
     }
-    
-    try:
-        with open(SESSION_FILE, 'w') as f:
-            json.dump(session_data, f)
-    except Exception as e:
-        print(f"保存会话状态失败: {e}")
+    _sessions.put(token, session_data)
+
+def drop_user_sessions(user_id):
+    """删除用户后调用：清掉内存中该用户的会话，避免后台写入把它们写回数据库"""
+    return _sessions.drop_user(user_id)
+
+def flush_sessions():
+    """立即写入尚未保存的会话（正常情况下由后台线程定期写入）"""
+    return _sessions.flush()
 
 def load_session_state():
-    """从文件加载会话状态"""
-    if not os.path.exists(SESSION_FILE):
+    """按当前令牌从服务端会话存储恢复会话状态"""
+    token = st.session_state.get('session_token')
+    if not token:
         return
     
-    try:
-        with open(SESSION_FILE, 'r') as f:
-            session_data = json.load(f)
-            
-        # 恢复会话状态
-        st.session_state.logged_in = session_data.get('logged_in', False)
-        st.session_state.user_id = session_data.get('user_id')
-        st.session_state.username = session_data.get('username')
-        st.session_state.is_admin = session_data.get('is_admin', False)
-        
-        # 恢复页面状态
-        if 'page' in session_data:
-            st.session_state.page = session_data['page']
-    except Exception as e:
-        print(f"加载会话状态失败: {e}")
+    session_data = _sessions.get(token)
+    if session_data is None or session_data.get('client') != _client_fingerprint():
+        # 令牌已过期、无效或来自别的客户端，丢弃它
+        st.session_state.session_token = None
+        return
+    
+    # 每次恢复都换发新令牌并作废旧令牌，泄露出去的旧令牌只能用到下一次加载为止
+    _sessions.delete(token)
+    _sessions.put(_new_session_token(), session_data)
+    
+    # 恢复会话状态
+    st.session_state.logged_in = session_data.get('logged_in', False)
+    st.session_state.user_id = session_data.get('user_id')
+    st.session_state.username = session_data.get('username')
+    st.session_state.is_admin = session_data.get('is_admin', False)
+    
+    # 恢复页面状态
+    if 'page' in session_data:
+        st.session_state.page = session_data['page']
 
 # 在页面状态改变时保存会话
 def update_page_state(new_page):
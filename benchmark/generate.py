@@ -0,0 +1,133 @@
+import os
+import random
+import time
+import database as db
+
+# Scale factor 1: 1000 users, 2000 questions, 100k attempts
+BASE_USERS = 1000
+BASE_QUESTIONS = 2000
+BASE_ATTEMPTS = 100000
+# Attempts are spread over this many days before now
+HISTORY_DAYS = 180
+INSERT_CHUNK_SIZE = 10000
+DEFAULT_CATEGORIES = ['操作系统', '数据结构', '计算机网络', '数据库', '算法基础', '编程语言', '软件工程', '人工智能']
+# Share of each question type in the generated bank
+QUESTION_TYPES = [('multiple_choice', 0.7), ('true_false', 0.2), ('short_answer', 0.1)]
+# Probability of a correct answer by difficulty
+CORRECT_RATE = {1: 0.85, 2: 0.7, 3: 0.5}
+
+def _weights(count, skew, rng):
+    # Zipf-like weights in random order: a few users/questions get most of the traffic
+    weights = [1.0 / (rank ** skew) for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return weights
+
+def generate_questions(count, categories, rng):
+    """Yield question dicts in the shape bulk_import_questions expects."""
+    types, type_weights = zip(*QUESTION_TYPES)
+    for number in range(count):
+        question_type = rng.choices(types, type_weights)[0]
+        category = categories[number % len(categories)]
+        question = {
+            'question_type': question_type,
+            'content': f"[基准测试] {category} 第 {number + 1} 题：{rng.getrandbits(64):016x}",
+            'difficulty': rng.choices((1, 2, 3), (0.3, 0.5, 0.2))[0],
+            'category': category,
+            'explanation': "自动生成的基准测试题目",
+        }
+        if question_type == 'multiple_choice':
+            question['options'] = "\n".join(f"{letter}. 选项 {letter}" for letter in "ABCD")
+            question['answer'] = rng.choice("ABCD")
+        elif question_type == 'true_false':
+            question['answer'] = rng.choice(("对", "错"))
+        else:
+            question['answer'] = "参考答案"
+        yield question
+
+def _insert_users(count, rng):
+    prefix = f"bench_{rng.getrandbits(32):08x}_"
+    with db.db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+            ((f"{prefix}{number}", 'bench', None) for number in range(count))
+        )
+        return [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE ?", (prefix + '%',))]
+
+def _insert_attempts(count, user_ids, questions, skew, rng):
+    user_weights = _weights(len(user_ids), skew, rng)
+    question_weights = _weights(len(questions), skew, rng)
+    now = time.time()
+    pending = {}
+
+    def flush(shard):
+        rows = pending.pop(shard, [])
+        if rows:
+            with db.shard_connection(shard) as conn:
+                conn.executemany(
+                    f"INSERT INTO user_progress ({db.ATTEMPT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+
+    remaining = count
+    while remaining:
+        batch = min(remaining, INSERT_CHUNK_SIZE)
+        users = rng.choices(user_ids, user_weights, k=batch)
+        picked = rng.choices(questions, question_weights, k=batch)
+        # Recent days are busier than old ones
+        offsets = sorted((rng.betavariate(1, 3) * HISTORY_DAYS * 86400 for _ in range(batch)), reverse=True)
+        for user_id, (question_id, difficulty, answer), offset in zip(users, picked, offsets):
+            correct = rng.random() < CORRECT_RATE[difficulty]
+            shard = db.shard_for_user(user_id)
+            pending.setdefault(shard, []).append(
+                (user_id, question_id, int(correct), answer if correct else 'X') + db.attempt_stamp(now - offset)
+            )
+        for shard in list(pending):
+            flush(shard)
+        remaining -= batch
+
+def generate(scale=1.0, users=None, questions=None, attempts=None, skew=1.0, seed=42):
+    """Fill the configured database with synthetic users, questions and attempts.
+
+    Counts default to the BASE_* figures times ``scale``. Users and question
+    popularity follow a Zipf-like distribution with exponent ``skew``;
+    correctness depends on difficulty. The materialized statistics are
+    rebuilt at the end. Returns the counts and the time taken.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    users = int(BASE_USERS * scale) if users is None else users
+    questions = int(BASE_QUESTIONS * scale) if questions is None else questions
+    attempts = int(BASE_ATTEMPTS * scale) if attempts is None else attempts
+
+    db.init_db()
+    categories = db.get_all_categories(include_empty=False) or DEFAULT_CATEGORIES
+    db.bulk_import_questions(generate_questions(questions, categories, rng))
+    question_rows = [(q['id'], q['difficulty'], q['answer']) for q in db.get_all_questions()]
+    user_ids = _insert_users(users, rng)
+    if attempts and user_ids and question_rows:
+        _insert_attempts(attempts, user_ids, question_rows, skew, rng)
+    db.rebuild_user_stats()
+    return {
+        "users": len(user_ids),
+        "questions": questions,
+        "attempts": attempts,
+        "seconds": time.perf_counter() - started
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成用于基准测试的模拟数据")
+    parser.add_argument("--db", default=os.environ.get('EXAM_DB_PATH', 'bench.db'), help="目标数据库文件")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help=f"规模系数：1 表示 {BASE_USERS} 个用户、{BASE_QUESTIONS} 道题、{BASE_ATTEMPTS} 条答题记录")
+    parser.add_argument("--users", type=int, help="用户数（覆盖规模系数）")
+    parser.add_argument("--questions", type=int, help="题目数（覆盖规模系数）")
+    parser.add_argument("--attempts", type=int, help="答题记录数（覆盖规模系数）")
+    parser.add_argument("--skew", type=float, default=1.0, help="用户和题目热度的偏斜程度（Zipf 指数）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    db.configure_database(args.db)
+    report = generate(args.scale, args.users, args.questions, args.attempts, args.skew, args.seed)
+    print(f"已生成 {report['users']} 个用户、{report['questions']} 道题、{report['attempts']} 条答题记录，"
+          f"耗时 {report['seconds']:.1f} 秒")
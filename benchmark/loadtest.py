@@ -0,0 +1,476 @@
+import os
+import sys
+import json
+import time
+import types
+import heapq
+import random
+import shutil
+import tempfile
+import importlib
+import threading
+import traceback
+from contextlib import contextmanager
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+from utils import query_stats
+from benchmark.runner import scratch_copy, _summary
+
+# Page renders run against a stand-in for the streamlit module: widgets return
+# scripted values, layout calls do nothing and st.session_state belongs to the
+# simulated user running on the current thread. The stub is only installed
+# while a load run imports and drives the pages (see streamlit_stub_installed).
+
+class RerunRequested(Exception):
+    pass
+
+class StopRequested(Exception):
+    pass
+
+class SessionState(dict):
+    """dict with attribute access, like st.session_state."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class _Block:
+    """Return value of layout calls: a context manager whose methods are the module's."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(streamlit_stub, name)
+
+def _noop(*args, **kwargs):
+    return _Block()
+
+def _cache(func=None, **kwargs):
+    # st.cache_data / st.cache_resource, with or without arguments; no caching
+    if func is None:
+        return lambda f: f
+    return func
+
+_local = threading.local()
+
+def _session():
+    return _local.session
+
+class _StreamlitStub(types.ModuleType):
+    """Minimal headless streamlit for driving the page functions."""
+
+    session_state = property(lambda self: _session().state)
+    sidebar = _Block()
+    cache_data = staticmethod(_cache)
+    cache_resource = staticmethod(_cache)
+
+    def __getattr__(self, name):
+        # markdown, metric, dataframe, plotly_chart, progress, ... render nothing
+        return _noop
+
+    @staticmethod
+    def experimental_rerun():
+        raise RerunRequested()
+
+    rerun = experimental_rerun
+
+    @staticmethod
+    def stop():
+        raise StopRequested()
+
+    @staticmethod
+    def button(label, key=None, **kwargs):
+        return _session().press(label, key)
+
+    @staticmethod
+    def form_submit_button(label="Submit", **kwargs):
+        return _session().press(label, None)
+
+    @staticmethod
+    def download_button(label, data=None, **kwargs):
+        return False
+
+    @staticmethod
+    def selectbox(label, options, index=0, **kwargs):
+        return _session().choose(label, list(options), index)
+
+    @staticmethod
+    def radio(label, options, index=0, **kwargs):
+        return _session().choose(label, list(options), index)
+
+    @staticmethod
+    def multiselect(label, options, default=None, **kwargs):
+        return list(default or [])
+
+    @staticmethod
+    def slider(label, min_value=None, max_value=None, value=None, **kwargs):
+        return value if value is not None else min_value
+
+    @staticmethod
+    def number_input(label, min_value=None, max_value=None, value=None, **kwargs):
+        return value if value is not None else (min_value or 0)
+
+    @staticmethod
+    def text_input(label, value="", **kwargs):
+        return _session().values.get(label, value)
+
+    @staticmethod
+    def text_area(label, value="", **kwargs):
+        return _session().values.get(label, value)
+
+    @staticmethod
+    def checkbox(label, value=False, **kwargs):
+        return value
+
+    @staticmethod
+    def file_uploader(label, **kwargs):
+        return None
+
+    @staticmethod
+    def columns(spec, **kwargs):
+        return [_Block() for _ in range(spec if isinstance(spec, int) else len(spec))]
+
+    @staticmethod
+    def tabs(labels):
+        return [_Block() for _ in labels]
+
+streamlit_stub = _StreamlitStub('streamlit')
+
+# App modules that bind ``streamlit`` at import time; they are imported afresh
+# against the stub and dropped again afterwards
+APP_MODULES = ('auth', 'utils.ui', 'pages.practice', 'pages.wrong_questions', 'pages.dashboard',
+               'pages.profile', 'pages.admin_question', 'pages.admin_user')
+
+LEARNER_PAGES = {
+    "刷题中心": ('pages.practice', 'practice_page'),
+    "错题概览": ('pages.wrong_questions', 'wrong_questions_page'),
+    "学习数据": ('pages.dashboard', 'dashboard_page'),
+    "个人中心": ('pages.profile', 'profile_page'),
+}
+ADMIN_PAGES = {
+    "题库管理": ('pages.admin_question', 'admin_question_page'),
+    "用户管理": ('pages.admin_user', 'admin_user_page'),
+}
+
+@contextmanager
+def streamlit_stub_installed():
+    """Make ``import streamlit`` return the stub inside the block and import the
+    app modules against it; yields (auth module, page name -> page function).
+
+    sys.modules and the package attributes of the app modules are restored on
+    exit, so the real streamlit and any app module imported before are back.
+    """
+    parents = {}
+    for name in APP_MODULES:
+        package, _, child = name.rpartition('.')
+        if package in sys.modules:
+            parents[name] = (sys.modules[package], child, getattr(sys.modules[package], child, None))
+    try:
+        with mock.patch.dict(sys.modules, {'streamlit': streamlit_stub}):
+            for name in APP_MODULES:
+                sys.modules.pop(name, None)
+            pages = {
+                page: getattr(importlib.import_module(module), func)
+                for page, (module, func) in {**LEARNER_PAGES, **ADMIN_PAGES}.items()
+            }
+            yield importlib.import_module('auth'), pages
+    finally:
+        for package, child, value in parents.values():
+            if value is None:
+                package.__dict__.pop(child, None)
+            else:
+                setattr(package, child, value)
+# Share of interactions going to each page; practice steps dominate in exam week
+LEARNER_MIX = {"刷题中心": 0.6, "错题概览": 0.15, "学习数据": 0.15, "个人中心": 0.1}
+ADMIN_MIX = {"题库管理": 0.4, "用户管理": 0.4, "学习数据": 0.2}
+# Streamlit reruns the script after st.experimental_rerun(); follow at most this many
+MAX_RERUNS = 3
+
+class SimulatedUser:
+    """One browser session: its own session_state, a random source and the
+    widgets to press on the next render."""
+
+    def __init__(self, user, is_admin, rng, pages):
+        self.rng = rng
+        self.is_admin = is_admin
+        self.pages = pages
+        self.state = SessionState(
+            logged_in=True, user_id=user['id'], username=user['username'], is_admin=is_admin, page='login',
+            session_token=f"load-{user['id']}-{rng.getrandbits(64):016x}"
+        )
+        self.presses = set()
+        self.values = {}
+
+    def press(self, label, key):
+        for name in (label, key):
+            if name in self.presses:
+                self.presses.discard(name)
+                return True
+        return False
+
+    def choose(self, label, options, index):
+        if not options:
+            return None
+        # Learners pick categories and answers; everything else keeps its default
+        if label in ("选择题目类别", "选择正确答案:"):
+            return self.rng.choice(options)
+        return options[index] if index is not None and index < len(options) else options[0]
+
+    def next_action(self):
+        """(page name, widgets to press) for the next interaction."""
+        mix = ADMIN_MIX if self.is_admin else LEARNER_MIX
+        page = self.rng.choices(list(mix), list(mix.values()))[0]
+        presses = []
+        if page == "刷题中心":
+            if self.state.get('show_practice_summary'):
+                presses = ["再次练习"]
+            elif self.state.get('practice_questions'):
+                presses = ["提交答案"]
+                self.values = {"输入你的答案:": "参考答案"}
+            else:
+                presses = ["开始练习"]
+        return page, presses
+
+    def render(self, page, presses):
+        func = self.pages[page]
+        self.presses = set(presses)
+        self.state.page = page
+        _local.session = self
+        try:
+            with query_stats.page(page):
+                for _ in range(MAX_RERUNS + 1):
+                    try:
+                        func()
+                        break
+                    except RerunRequested:
+                        # The rerun sees fresh widgets, nothing pressed
+                        self.presses = set()
+                    except StopRequested:
+                        break
+        finally:
+            _local.session = None
+
+class LoadReport:
+    """Thread-safe collector of per-page latencies and errors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.error_samples = {}
+
+    def add(self, page, seconds, error=None):
+        with self._lock:
+            self.latencies.setdefault(page, []).append(seconds)
+            if error is not None:
+                name = f"{type(error).__name__}: {error}"
+                self.errors.setdefault(page, {}).setdefault(name, 0)
+                self.errors[page][name] += 1
+                self.error_samples.setdefault(name, ''.join(traceback.format_exception(
+                    type(error), error, error.__traceback__)))
+
+    def summary(self):
+        pages = {}
+        with self._lock:
+            for page, samples in self.latencies.items():
+                errors = sum(self.errors.get(page, {}).values())
+                entry = {"requests": len(samples), "errors": errors, "error_rate": errors / len(samples)}
+                entry.update(_summary(samples))
+                del entry["iterations"]
+                entry["error_types"] = self.errors.get(page, {})
+                pages[page] = entry
+        return pages
+
+def _load_users(learners, admins):
+    """Existing accounts for the simulated sessions, creating load_* accounts if there are too few."""
+    with db.db_connection() as conn:
+        rows = conn.execute("SELECT id, username, is_admin FROM users ORDER BY id").fetchall()
+    learner_rows = [dict(row) for row in rows if not row['is_admin']]
+    admin_rows = [dict(row) for row in rows if row['is_admin']]
+    for role, have, want, is_admin in (('learner', learner_rows, learners, 0), ('admin', admin_rows, admins, 1)):
+        for number in range(len(have), want):
+            username = f"load_{role}_{number}"
+            db.create_user(username, 'load', None, is_admin)
+            user = db.verify_user(username, 'load')
+            have.append({'id': user['id'], 'username': user['username'], 'is_admin': is_admin})
+    return learner_rows[:learners], admin_rows[:admins]
+
+class _Schedule:
+    """Simulated users ordered by when their next interaction is due.
+
+    A user is taken out while a worker renders for it and put back with its
+    next due time, so any number of workers can serve any number of users.
+    """
+
+    def __init__(self, sessions):
+        now = time.monotonic()
+        self._lock = threading.Lock()
+        self._heap = [(now, index, sim) for index, sim in enumerate(sessions)]
+        heapq.heapify(self._heap)
+
+    def take(self, deadline):
+        """The user due soonest, after waiting until it is due; None once the deadline passes."""
+        while True:
+            with self._lock:
+                entry = heapq.heappop(self._heap) if self._heap else None
+            now = time.monotonic()
+            if now >= deadline:
+                return None
+            if entry is None:
+                # Every user is being served by another worker
+                time.sleep(min(0.01, deadline - now))
+                continue
+            due, index, sim = entry
+            if due > now:
+                time.sleep(min(due, deadline) - now)
+                if time.monotonic() >= deadline:
+                    return None
+            return index, sim
+
+    def put(self, index, sim, due):
+        with self._lock:
+            heapq.heappush(self._heap, (due, index, sim))
+
+def _worker(schedule, deadline, think_time, report):
+    while True:
+        taken = schedule.take(deadline)
+        if taken is None:
+            return
+        index, sim = taken
+        page, presses = sim.next_action()
+        started = time.perf_counter()
+        error = None
+        try:
+            sim.render(page, presses)
+        except Exception as e:
+            error = e
+        report.add(page, time.perf_counter() - started, error)
+        think = sim.rng.expovariate(1.0 / think_time) if think_time else 0
+        schedule.put(index, sim, time.monotonic() + think)
+
+def run_load(learners=100, admins=5, duration=30.0, think_time=1.0, threads=None, seed=11):
+    """Drive the page functions with concurrent simulated sessions against the
+    configured database and return the report.
+
+    A pool of ``threads`` workers (default one per session) serves the
+    sessions in order of their next due interaction, so fewer workers than
+    sessions still spreads the load over every session. Each interaction
+    renders a page from LEARNER_MIX / ADMIN_MIX, and sessions pause an
+    exponentially distributed think time in between.
+    """
+    rng = random.Random(seed)
+    db.ensure_schema()
+    learner_rows, admin_rows = _load_users(learners, admins)
+    report = LoadReport()
+    query_stats.reset()
+    pools = [db.get_pool()] + (db.get_shard_pools() if db.SHARD_COUNT else [])
+    waits_before = [(pool.waits, pool.wait_seconds) for pool in pools]
+
+    with streamlit_stub_installed() as (auth, pages):
+        sessions = [SimulatedUser(user, False, random.Random(rng.random()), pages) for user in learner_rows]
+        sessions += [SimulatedUser(user, True, random.Random(rng.random()), pages) for user in admin_rows]
+        threads = threads or len(sessions)
+        schedule = _Schedule(sessions)
+        started = time.perf_counter()
+        deadline = time.monotonic() + duration
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for _ in range(threads):
+                executor.submit(_worker, schedule, deadline, think_time, report)
+        db.flush_attempts()
+        elapsed = time.perf_counter() - started
+        # Write the sessions the pages saved while the database is still configured
+        auth.flush_sessions()
+
+    pages = report.summary()
+    requests = sum(page["requests"] for page in pages.values())
+    errors = sum(page["errors"] for page in pages.values())
+    return {
+        "meta": {
+            "started_at": time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+            "learners": len(learner_rows),
+            "admins": len(admin_rows),
+            "threads": threads,
+            "duration": duration,
+            "think_time": think_time,
+            "shards": db.SHARD_COUNT,
+            "pool_size": db.POOL_SIZE,
+            "seconds": elapsed,
+        },
+        "totals": {
+            "requests": requests,
+            "errors": errors,
+            "error_rate": errors / requests if requests else 0,
+            "requests_per_second": requests / elapsed if elapsed else 0,
+        },
+        "pages": pages,
+        "lock_waits": {
+            "pool_waits": sum(pool.waits - before[0] for pool, before in zip(pools, waits_before)),
+            "pool_wait_seconds": sum(pool.wait_seconds - before[1] for pool, before in zip(pools, waits_before)),
+            "write_lock": query_stats.get_lock_wait_stats(),
+        },
+        "error_samples": report.error_samples,
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="模拟大量并发用户访问页面的压力测试")
+    parser.add_argument("--db", default=os.environ.get('EXAM_DB_PATH', 'bench.db'),
+                        help="测试数据库（可先用 python -m benchmark.generate 生成）")
+    parser.add_argument("--learners", type=int, default=100, help="模拟学生数")
+    parser.add_argument("--admins", type=int, default=5, help="模拟管理员数")
+    parser.add_argument("--duration", type=float, default=30, help="持续时间（秒）")
+    parser.add_argument("--think-time", type=float, default=1.0, help="两次操作之间的平均间隔（秒）")
+    parser.add_argument("--threads", type=int, help="线程池大小（默认每个模拟用户一个线程）")
+    parser.add_argument("--in-place", action="store_true", help="直接在数据库上测试，而不是在临时副本上")
+    parser.add_argument("--seed", type=int, default=11, help="随机种子")
+    parser.add_argument("--trace", action="store_true",
+                        help="开启 SQL 统计以报告写锁等待（同 EXAM_SQL_TRACE=1，会略增开销）")
+    parser.add_argument("--out", help="结果 JSON 文件")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"数据库 {args.db} 不存在，请先运行 python -m benchmark.generate --db {args.db}")
+        sys.exit(1)
+    if args.trace:
+        query_stats.TRACE_ENABLED = True
+    workdir = tempfile.mkdtemp(prefix='exam-load-')
+    try:
+        db.configure_database(args.db if args.in_place else scratch_copy(args.db, workdir))
+        report = run_load(args.learners, args.admins, args.duration, args.think_time, args.threads, args.seed)
+    finally:
+        db.close_database()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'页面':10s}{'请求数':>8s}{'错误率':>8s}{'P50(ms)':>10s}{'P95(ms)':>10s}{'P99(ms)':>10s}")
+    for page, entry in report["pages"].items():
+        print(f"{page:10s}{entry['requests']:>8d}{entry['error_rate']:>8.1%}"
+              f"{entry['p50_ms']:>10.1f}{entry['p95_ms']:>10.1f}{entry['p99_ms']:>10.1f}")
+    totals, waits = report["totals"], report["lock_waits"]
+    print(f"共 {totals['requests']} 次请求，{totals['requests_per_second']:.1f} 次/秒，错误率 {totals['error_rate']:.1%}")
+    print(f"连接池等待 {waits['pool_waits']} 次，共 {waits['pool_wait_seconds']:.2f} 秒")
+    if query_stats.TRACE_ENABLED:
+        print(f"写锁等待 P95 {waits['write_lock']['p95_ms']:.1f} ms，最大 {waits['write_lock']['max_ms']:.1f} ms")
+    for name in report["error_samples"]:
+        print(f"错误: {name}")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.out}")
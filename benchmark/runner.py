@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import platform
+import tempfile
+import database as db
+from benchmark.generate import generate_questions
+
+RESULTS_DIR = os.path.join('benchmark', 'results')
+DEFAULT_ITERATIONS = 200
+# Attempts submitted for the record_attempt throughput figure
+RECORD_ATTEMPTS = 20000
+IMPORT_QUESTIONS = 5000
+PERCENTILES = (50, 95, 99)
+
+def _summary(samples):
+    ordered = sorted(samples)
+    result = {
+        "iterations": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "min_ms": ordered[0] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+    for p in PERCENTILES:
+        # Nearest-rank percentile
+        result[f"p{p}_ms"] = ordered[max(0, -(-len(ordered) * p // 100) - 1)] * 1000
+    result["ops_per_second"] = len(ordered) / sum(ordered) if sum(ordered) > 0 else 0
+    return result
+
+def _time_calls(func, args_list):
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - started)
+    return _summary(samples)
+
+def _dataset(conn):
+    counts = {}
+    for table in ('users', 'questions'):
+        counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return counts
+
+def copy_database(source, target):
+    # The backup API gives a consistent copy even if the source is in WAL mode
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+def scratch_copy(db_path, workdir):
+    """Copy db_path and its shard files into workdir; returns the copy's path."""
+    db.configure_database(db_path)
+    for source in [db_path] + [db.shard_path(index) for index in range(db.SHARD_COUNT)]:
+        copy_database(source, os.path.join(workdir, os.path.basename(source)))
+    return os.path.join(workdir, os.path.basename(db_path))
+
+def run_benchmarks(iterations=DEFAULT_ITERATIONS, record_attempts=RECORD_ATTEMPTS,
+                   import_questions=IMPORT_QUESTIONS, seed=7):
+    """Time the main database.py entry points against the configured database.
+
+    Read benchmarks pick categories at random and users from the 100 most
+    active ones (seeded). Returns {benchmark name: summary}.
+    """
+    rng = random.Random(seed)
+    db.ensure_schema()
+    with db.db_connection() as conn:
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+    active = [row['id'] for row in db.get_users_with_stats(sort='total_attempts', descending=True, limit=100)]
+    categories = db.get_all_categories(include_empty=False)
+    picked_users = [(rng.choice(active or user_ids),) for _ in range(iterations)]
+    results = {}
+
+    # Warm the question catalog so its one-off load is not charged to the first call
+    db.get_random_questions(1)
+    results["get_random_questions"] = _time_calls(
+        db.get_random_questions,
+        [(10, rng.choice(categories) if categories else None, rng.choice((None, 1, 2, 3)))
+         for _ in range(iterations)]
+    )
+    results["get_user_stats"] = _time_calls(db.get_user_stats, picked_users)
+    results["get_user_wrong_questions"] = _time_calls(
+        lambda user_id: db.get_user_wrong_questions(user_id, limit=20), picked_users
+    )
+    results["get_user_progress"] = _time_calls(
+        lambda user_id: db.get_user_progress(user_id, limit=50), picked_users
+    )
+    results["get_users_with_stats"] = _time_calls(
+        lambda sort: db.get_users_with_stats(sort=sort, descending=True, limit=20),
+        [(rng.choice(list(db.USER_SORTS)),) for _ in range(max(1, iterations // 10))]
+    )
+
+    # Bulk import: rows per second for one transaction of fresh questions
+    report = db.bulk_import_questions(generate_questions(import_questions, categories or ['基准测试'], rng))
+    results["bulk_import_questions"] = {
+        "rows": report["imported"] + report["skipped"],
+        "seconds": report["seconds"],
+        "rows_per_second": report["rows_per_second"],
+    }
+
+    # record_attempt: time to enqueue and commit record_attempts attempts
+    questions = db.get_all_questions()
+    started = time.perf_counter()
+    for _ in range(record_attempts):
+        question = rng.choice(questions)
+        db.record_attempt(rng.choice(user_ids), question['id'], rng.random() < 0.7, question['answer'])
+    enqueued = time.perf_counter() - started
+    db.flush_attempts()
+    seconds = time.perf_counter() - started
+    results["record_attempt"] = {
+        "attempts": record_attempts,
+        "seconds": seconds,
+        "enqueue_seconds": enqueued,
+        "attempts_per_second": record_attempts / seconds if seconds > 0 else 0,
+    }
+    return results
+
+def run(db_path, iterations=DEFAULT_ITERATIONS, record_attempts=RECORD_ATTEMPTS,
+        import_questions=IMPORT_QUESTIONS, seed=7):
+    """Benchmark a scratch copy of db_path (and its shards) and return the
+    JSON-ready report.
+
+    The copy keeps runs repeatable: imports and recorded attempts never
+    touch the source database.
+    """
+    workdir = tempfile.mkdtemp(prefix='exam-bench-')
+    try:
+        db.configure_database(scratch_copy(db_path, workdir))
+        db.ensure_schema()
+        with db.db_connection() as conn:
+            dataset = _dataset(conn)
+        dataset["attempts"] = sum(table["rows"] for table in db.get_archive_status().values())
+        started = time.perf_counter()
+        results = run_benchmarks(iterations, record_attempts, import_questions, seed)
+        return {
+            "meta": {
+                "started_at": time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+                "database": os.path.abspath(db_path),
+                "dataset": dataset,
+                "shards": db.SHARD_COUNT,
+                "iterations": iterations,
+                "seed": seed,
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "seconds": time.perf_counter() - started,
+            },
+            "results": results,
+        }
+    finally:
+        db.configure_database(db_path)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# Headline figure per benchmark for comparisons: (key, higher is better)
+HEADLINE = {
+    "bulk_import_questions": ("rows_per_second", True),
+    "record_attempt": ("attempts_per_second", True),
+}
+
+def compare(baseline, current):
+    """Rows of (benchmark, metric, baseline, current, change %) for benchmarks in both reports.
+    A positive change is an improvement."""
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        metric, higher_is_better = HEADLINE.get(name, ("p50_ms", False))
+        before = baseline["results"][name].get(metric)
+        after = result.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        rows.append((name, metric, before, after, change if higher_is_better else -change))
+    return rows
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="数据库层基准测试")
+    parser.add_argument("--db", default=os.environ.get('EXAM_DB_PATH', 'bench.db'),
+                        help="基准测试数据库（可先用 python -m benchmark.generate 生成）")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="每个读取操作的调用次数")
+    parser.add_argument("--record-attempts", type=int, default=RECORD_ATTEMPTS, help="写入吞吐测试的答题记录数")
+    parser.add_argument("--import-questions", type=int, default=IMPORT_QUESTIONS, help="批量导入测试的题目数")
+    parser.add_argument("--seed", type=int, default=7, help="随机种子")
+    parser.add_argument("--out", help="结果 JSON 文件（默认写入 benchmark/results/ 下带时间戳的文件）")
+    parser.add_argument("--compare", help="与之前的结果 JSON 文件对比")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"数据库 {args.db} 不存在，请先运行 python -m benchmark.generate --db {args.db}")
+        sys.exit(1)
+    report = run(args.db, args.iterations, args.record_attempts, args.import_questions, args.seed)
+    out = args.out or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, result in report["results"].items():
+        metric, _ = HEADLINE.get(name, ("p50_ms", False))
+        print(f"{name:28s} {metric:20s} {result[metric]:12.3f}")
+    print(f"结果已写入 {out}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"与 {args.compare} 对比（正数表示变快）:")
+        for name, metric, before, after, change in compare(baseline, report):
+            print(f"{name:28s} {metric:20s} {before:12.3f} -> {after:12.3f} {change:+7.1f}%")
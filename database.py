@@ -1,113 +1,623 @@
 import sqlite3
 import os
+import queue
+import random
+import hashlib
+import unicodedata
+import html
+import atexit
+import threading
+import time
+import gzip
+import shutil
+import heapq
+import itertools
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from utils.question_parser import parse_questions_file
+from utils import query_stats
 
-# Database connection
-def get_db_connection():
-    conn = sqlite3.connect('exam_system.db')
+# Database location and connection tuning
+DB_PATH = os.environ.get('EXAM_DB_PATH', 'exam_system.db')
+POOL_SIZE = int(os.environ.get('EXAM_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = 30  # seconds to wait for a free pooled connection
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 20000
+
+# Write-behind attempt recording: commit every ATTEMPT_FLUSH_INTERVAL seconds
+# or ATTEMPT_BATCH_SIZE rows, whichever comes first
+ATTEMPT_QUEUE_SIZE = 10000
+ATTEMPT_BATCH_SIZE = 500
+ATTEMPT_FLUSH_INTERVAL = 0.05
+# Sequence numbers of attempts that could not be written, kept for wait_for()
+ATTEMPT_FAILED_KEEP = 10000
+# Row-by-row retries of a failed batch give up after this many seconds
+ATTEMPT_RETRY_SECONDS = 2.0
+
+# Bulk imports insert this many rows per executemany call
+IMPORT_CHUNK_SIZE = 5000
+# Rows per statement when deleting questions and their attempts in bulk
+DELETE_CHUNK_SIZE = 500
+
+# Attempts older than the horizon move from user_progress to user_progress_archive
+ARCHIVE_HORIZON_DAYS = int(os.environ.get('EXAM_ARCHIVE_HORIZON_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = 2000
+
+# Rows per read when streaming attempt history out for export
+EXPORT_BATCH_SIZE = 5000
+
+# Online backups: copy BACKUP_PAGES_PER_STEP pages, then sleep so writers get in
+BACKUP_DIR = os.environ.get('EXAM_BACKUP_DIR', 'backups')
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+BACKUP_MAX_RESTARTS = 5
+BACKUP_KEEP = 7
+
+# Optional sharding: with EXAM_DB_SHARDS=N, attempts and the per-user
+# statistics live in N shard files picked by user id; users and questions
+# stay in DB_PATH (the catalog). 0 keeps everything in one file.
+SHARD_COUNT = int(os.environ.get('EXAM_DB_SHARDS', '0'))
+# Each shard numbers its attempts from index * SHARD_ID_SPACING so attempt ids stay globally unique
+SHARD_ID_SPACING = 1 << 40
+
+def _configure_connection(conn):
     conn.row_factory = sqlite3.Row
+    # WAL lets readers proceed while a writer commits; NORMAL sync is safe in WAL mode
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections to a single database file.
+
+    Connections are created lazily up to ``size`` and handed out by
+    ``connection()``. Nested ``connection()`` calls on the same thread reuse
+    the outer connection, so helpers can be composed inside one transaction.
+    """
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT, attach=None):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        # {schema name: path} attached to every connection
+        self.attach = attach or {}
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Times a caller had to wait for a connection, and for how long in total
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               factory=query_stats.connection_factory())
+        _configure_connection(conn)
+        for name, path in self.attach.items():
+            conn.execute(f"ATTACH DATABASE ? AS {name}", (path,))
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"no database connection available after {self.timeout}s")
+        finally:
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - started
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped instead of being returned to the pool
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Yield a pooled connection; commit on success, roll back on error."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH, size=POOL_SIZE)
+    return _pool
+
+def configure_database(path=None, pool_size=None, shards=None):
+    """Point the module at another database file (or resize the pool, or change the shard count)."""
+    global DB_PATH, POOL_SIZE, SHARD_COUNT, _pool, _shard_pools, _schema_ready
+    # Queued attempts belong to the database they were recorded against
+    flush_attempts()
+    with _pool_lock:
+        _schema_ready = False
+        if path is not None:
+            DB_PATH = path
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if shards is not None:
+            SHARD_COUNT = shards
+        for pool in [_pool] + (_shard_pools or []):
+            if pool is not None:
+                pool.close_all()
+        _pool = None
+        _shard_pools = None
+    _catalog.reset()
+
+def close_database():
+    with _pool_lock:
+        for pool in [_pool] + (_shard_pools or []):
+            if pool is not None:
+                pool.close_all()
+
+atexit.register(close_database)
+
+def db_connection():
+    """Context manager yielding a pooled connection (see ConnectionPool.connection)."""
+    return get_pool().connection()
+
+# Shard routing
+# Shard connections attach the catalog as "catalog", so unqualified users and
+# questions in per-user queries resolve there and the SQL is the same either way.
+_shard_pools = None
+
+def shard_count():
+    return SHARD_COUNT or 1
+
+def shard_path(index):
+    root, ext = os.path.splitext(DB_PATH)
+    return f"{root}.shard{index}{ext or '.db'}"
+
+def shard_for_user(user_id):
+    # User ids are sequential, so modulo spreads them evenly
+    return int(user_id) % SHARD_COUNT if SHARD_COUNT else 0
+
+def get_shard_pools():
+    """One pool per shard; the catalog pool itself when sharding is off."""
+    global _shard_pools
+    if not SHARD_COUNT:
+        return [get_pool()]
+    if _shard_pools is None:
+        with _pool_lock:
+            if _shard_pools is None:
+                _shard_pools = [ConnectionPool(shard_path(index), size=POOL_SIZE, attach={'catalog': DB_PATH})
+                                for index in range(SHARD_COUNT)]
+    return _shard_pools
+
+def shard_connection(index):
+    return get_shard_pools()[index].connection()
+
+def user_connection(user_id):
+    """Connection to the database holding user_id's attempts and statistics."""
+    return shard_connection(shard_for_user(user_id))
+
+def _shard_connections():
+    """Yield a connection to every shard in turn, each in its own transaction.
+    Unsharded, this is the catalog connection (the caller's, if it holds one)."""
+    for index in range(shard_count()):
+        with shard_connection(index) as conn:
+            yield conn
+
+# Standalone connection for scripts that manage its lifetime themselves
+def get_db_connection():
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000)
+    return _configure_connection(conn)
+
+USER_PROGRESS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS user_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    question_id INTEGER NOT NULL,
+    is_correct INTEGER NOT NULL,
+    user_answer TEXT,
+    attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    attempt_ts INTEGER,
+    attempt_day INTEGER,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (question_id) REFERENCES questions (id)
+)
+'''
+
 # Initialize database
 def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        email TEXT,
-        is_admin INTEGER DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create questions table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS questions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        question_type TEXT NOT NULL,
-        content TEXT NOT NULL,
-        options TEXT,
-        answer TEXT NOT NULL,
-        explanation TEXT,
-        difficulty INTEGER NOT NULL,
-        category TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create user_progress table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS user_progress (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        question_id INTEGER NOT NULL,
-        is_correct INTEGER NOT NULL,
-        user_answer TEXT,
-        attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id),
-        FOREIGN KEY (question_id) REFERENCES questions (id)
-    )
-    ''')
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Create users table
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT,
+            is_admin INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        
+        # Create questions table
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            options TEXT,
+            answer TEXT NOT NULL,
+            explanation TEXT,
+            difficulty INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        
+        # Create user_progress table
+        cursor.execute(USER_PROGRESS_TABLE_SQL)
+        
+        # Create an admin user if it doesn't exist
+        cursor.execute("SELECT * FROM users WHERE username = 'admin'")
+        if not cursor.fetchone():
+            cursor.execute("INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
+                          ('admin', 'admin123', 1))
     
-    # Create an admin user if it doesn't exist
-    cursor.execute("SELECT * FROM users WHERE username = 'admin'")
-    if not cursor.fetchone():
-        cursor.execute("INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
-                      ('admin', 'admin123', 1))
+    if SHARD_COUNT:
+        for index in range(SHARD_COUNT):
+            with shard_connection(index) as conn:
+                conn.execute(USER_PROGRESS_TABLE_SQL)
+                conn.execute("""
+                    INSERT INTO sqlite_sequence (name, seq)
+                    SELECT 'user_progress', ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'user_progress')
+                """, (index * SHARD_ID_SPACING,))
     
-    conn.commit()
-    conn.close()
+    # Bring the schema up to date (indexes and later additions)
+    migrate()
+    backfill_attempt_timestamps()
+
+# Schema migrations
+# Each step is (version, description, statements); statements is a list of SQL
+# strings or a callable taking the connection. Steps run in order, once each,
+# inside their own transaction; a step that raises MigrationDeferred is left
+# unrecorded and retried on the next start. Append new steps; never edit
+# applied ones.
+MIGRATIONS = [
+    (1, "index user_progress by user and attempt time", [
+        "CREATE INDEX IF NOT EXISTS idx_progress_user_time ON user_progress (user_id, attempt_time)",
+    ]),
+    (2, "index user_progress by user, correctness and question", [
+        "CREATE INDEX IF NOT EXISTS idx_progress_user_correct ON user_progress (user_id, is_correct, question_id)",
+    ]),
+    (3, "index questions by category and difficulty", [
+        "CREATE INDEX IF NOT EXISTS idx_questions_category_difficulty ON questions (category, difficulty)",
+    ]),
+    (4, "track a question bank version bumped by every question write", [
+        """CREATE TABLE IF NOT EXISTS question_bank_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )""",
+        "INSERT OR IGNORE INTO question_bank_version (id, version) VALUES (1, 0)",
+        """CREATE TRIGGER IF NOT EXISTS trg_questions_version_insert AFTER INSERT ON questions
+        BEGIN UPDATE question_bank_version SET version = version + 1 WHERE id = 1; END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_questions_version_update AFTER UPDATE ON questions
+        BEGIN UPDATE question_bank_version SET version = version + 1 WHERE id = 1; END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_questions_version_delete AFTER DELETE ON questions
+        BEGIN UPDATE question_bank_version SET version = version + 1 WHERE id = 1; END""",
+    ]),
+    (5, "materialized per-user statistics tables", [
+        """CREATE TABLE IF NOT EXISTS user_stats_summary (
+            user_id INTEGER PRIMARY KEY,
+            total_attempts INTEGER NOT NULL DEFAULT 0,
+            correct_answers INTEGER NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS user_category_stats (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category)
+        )""",
+        """CREATE TABLE IF NOT EXISTS user_difficulty_stats (
+            user_id INTEGER NOT NULL,
+            difficulty INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, difficulty)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_progress_question ON user_progress (question_id)",
+    ]),
+    (6, "backfill per-user statistics", lambda conn: _rebuild_user_aggregates(conn)),
+    (7, "daily activity rollup and streak counters", [
+        """CREATE TABLE IF NOT EXISTS user_daily_activity (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID""",
+        "ALTER TABLE user_stats_summary ADD COLUMN current_streak INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE user_stats_summary ADD COLUMN longest_streak INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE user_stats_summary ADD COLUMN last_active_day TEXT",
+    ]),
+    (8, "backfill daily activity and streaks", lambda conn: _rebuild_user_aggregates(conn)),
+    (9, "mistake ledger keyed by user and question", [
+        """CREATE TABLE IF NOT EXISTS user_mistakes (
+            user_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            category TEXT,
+            difficulty INTEGER,
+            wrong_count INTEGER NOT NULL DEFAULT 0,
+            last_wrong_answer TEXT,
+            last_wrong_time TIMESTAMP,
+            resolved INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, question_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_mistakes_user_time ON user_mistakes (user_id, last_wrong_time)",
+        "CREATE INDEX IF NOT EXISTS idx_mistakes_user_difficulty ON user_mistakes (user_id, difficulty, last_wrong_time)",
+        "CREATE INDEX IF NOT EXISTS idx_mistakes_user_category_time ON user_mistakes (user_id, category, last_wrong_time)",
+        "CREATE INDEX IF NOT EXISTS idx_mistakes_user_category_difficulty ON user_mistakes (user_id, category, difficulty)",
+        "CREATE INDEX IF NOT EXISTS idx_mistakes_question ON user_mistakes (question_id)",
+    ]),
+    (10, "backfill mistake ledger", lambda conn: _rebuild_user_aggregates(conn)),
+    (11, "content hash column, dedupe pass and unique index", lambda conn: _migrate_content_hash(conn)),
+    (12, "FTS5 trigram index over question text", lambda conn: _migrate_question_search(conn)),
+    (13, "indexes for filtered, keyset-paginated question listing", [
+        "CREATE INDEX IF NOT EXISTS idx_questions_category ON questions (category)",
+        "CREATE INDEX IF NOT EXISTS idx_questions_difficulty ON questions (difficulty)",
+        "CREATE INDEX IF NOT EXISTS idx_questions_type ON questions (question_type, category, difficulty)",
+    ]),
+    (14, "category catalog with trigger-maintained question counts", lambda conn: _migrate_category_catalog(conn)),
+    (15, "cold archive for old attempts and a view over full history", [
+        """CREATE TABLE IF NOT EXISTS user_progress_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            is_correct INTEGER NOT NULL,
+            user_answer TEXT,
+            attempt_time TIMESTAMP
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_archive_user_time ON user_progress_archive (user_id, attempt_time)",
+        "CREATE INDEX IF NOT EXISTS idx_archive_question ON user_progress_archive (question_id)",
+        """CREATE VIEW IF NOT EXISTS user_progress_all AS
+            SELECT id, user_id, question_id, is_correct, user_answer, attempt_time FROM user_progress
+            UNION ALL
+            SELECT id, user_id, question_id, is_correct, user_answer, attempt_time FROM user_progress_archive""",
+    ]),
+    (16, "integer epoch and day number columns on attempts", lambda conn: _migrate_attempt_timestamps(conn)),
+    (17, "server-side login sessions keyed by browser token", [
+        """CREATE TABLE IF NOT EXISTS sessions (
+            token TEXT PRIMARY KEY,
+            user_id INTEGER,
+            data TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)",
+    ]),
+    (18, "distinct answered question count in the per-user summary", lambda conn: _migrate_answered_questions(conn)),
+]
+
+def _progress_tables(conn):
+    """Physical tables holding attempts: the hot log plus the archive once it exists."""
+    if _table_exists(conn, 'user_progress_archive'):
+        return ('user_progress', 'user_progress_archive')
+    return ('user_progress',)
+
+def _progress_source(conn):
+    """Relation covering every attempt, hot and archived."""
+    return 'user_progress_all' if _table_exists(conn, 'user_progress_all') else 'user_progress'
+
+def _table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (name,)).fetchone()
+    return row is not None
+
+def _column_exists(conn, table, column):
+    return any(row['name'] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+# Steps that build per-user tables; with sharding they run on every shard
+# instead of the catalog
+USER_DATA_MIGRATIONS = {1, 2, 5, 6, 7, 8, 9, 10, 15, 16, 18}
+
+def _schema_version(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def get_schema_version():
+    with db_connection() as conn:
+        return _schema_version(conn)
+
+class MigrationDeferred(Exception):
+    """Raised by a migration step that cannot run with this SQLite build; the
+    step is rolled back, left unrecorded and retried on the next start."""
+
+def _apply_migrations(pool, applies):
+    """Apply pending MIGRATIONS for which applies(version) is true to one database file."""
+    with pool.connection() as conn:
+        current = _schema_version(conn)
+        done = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+        for version, description, statements in MIGRATIONS:
+            if version in done or not applies(version):
+                continue
+            # IMMEDIATE takes the write lock up front so concurrent workers
+            # starting at the same time apply each step exactly once
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                applied = conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone()
+                if not applied:
+                    if callable(statements):
+                        statements(conn)
+                    else:
+                        for statement in statements:
+                            conn.execute(statement)
+                    conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                                 (version, description))
+                conn.commit()
+            except MigrationDeferred as e:
+                conn.rollback()
+                print(f"迁移 {version} 暂缓执行: {e}")
+                continue
+            except Exception:
+                conn.rollback()
+                raise
+            current = max(current, version)
+    return current
+
+def migrate():
+    """Apply pending MIGRATIONS and return the resulting (catalog) schema version."""
+    if not SHARD_COUNT:
+        return _apply_migrations(get_pool(), lambda version: True)
+    current = _apply_migrations(get_pool(), lambda version: version not in USER_DATA_MIGRATIONS)
+    for pool in get_shard_pools():
+        _apply_migrations(pool, lambda version: version in USER_DATA_MIGRATIONS)
+    return current
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    """Run init_db() once per process; cheap to call on every Streamlit rerun."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            init_db()
+            _schema_ready = True
 
 # User management functions
 def create_user(username, password, email=None, is_admin=0):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO users (username, password, email, is_admin) VALUES (?, ?, ?, ?)",
-            (username, password, email, is_admin)
-        )
-        conn.commit()
+        with db_connection() as conn:
+            conn.execute(
+                "INSERT INTO users (username, password, email, is_admin) VALUES (?, ?, ?, ?)",
+                (username, password, email, is_admin)
+            )
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 def verify_user(username, password):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, password))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+    with db_connection() as conn:
+        cursor = conn.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, password))
+        return cursor.fetchone()
 
 def get_user_by_id(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+    with db_connection() as conn:
+        cursor = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        return cursor.fetchone()
 
 def get_all_users():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users")
-    users = cursor.fetchall()
-    conn.close()
-    return users
+    with db_connection() as conn:
+        cursor = conn.execute("SELECT * FROM users")
+        return cursor.fetchall()
 
-def update_user(user_id, username=None, email=None, password=None, is_admin=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+# Sort keys for the admin user list
+USER_SORTS = {
+    'id': "u.id",
+    'username': "u.username",
+    'created_at': "u.created_at",
+    'total_attempts': "total_attempts",
+    'accuracy': "accuracy",
+}
+
+def count_users():
+    with db_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+def get_users_with_stats(sort='id', descending=False, limit=50, offset=0):
+    """One page of users with attempt totals and accuracy from the summary table."""
+    flush_attempts()
+    direction = "DESC" if descending else "ASC"
+    query = f"""
+        SELECT u.id, u.username, u.email, u.is_admin, u.created_at,
+               COALESCE(s.total_attempts, 0) as total_attempts,
+               COALESCE(s.correct_answers, 0) as correct_answers,
+               CASE WHEN s.total_attempts > 0
+                    THEN s.correct_answers * 100.0 / s.total_attempts ELSE 0 END as accuracy
+        FROM users u
+        LEFT JOIN user_stats_summary s ON s.user_id = u.id
+        {{where}}
+        ORDER BY {USER_SORTS[sort]} {direction}, u.id {direction}
+        LIMIT ? OFFSET ?
+    """
+    if not SHARD_COUNT:
+        with db_connection() as conn:
+            return conn.execute(query.format(where=""), (limit, offset)).fetchall()
     
+    # Each shard sorts its own users; merge the sorted runs and cut the page
+    runs = []
+    for index, conn in enumerate(_shard_connections()):
+        runs.append(conn.execute(query.format(where=f"WHERE u.id % {SHARD_COUNT} = {index}"),
+                                 (limit + offset, 0)).fetchall())
+    merged = heapq.merge(*runs, key=lambda row: (row[sort], row['id']), reverse=descending)
+    return list(itertools.islice(merged, offset, offset + limit))
+
+def update_user(user_id, username=None, email=None, password=None, is_admin=None):
     # Build update query based on provided parameters
     update_fields = []
     params = []
@@ -126,107 +636,259 @@ def update_user(user_id, username=None, email=None, password=None, is_admin=None
         params.append(is_admin)
     
     if not update_fields:
-        conn.close()
         return False
     
     params.append(user_id)
     query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = ?"
     
-    cursor.execute(query, params)
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute(query, params)
     return True
 
 def delete_user(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    flush_attempts(user_id=user_id)
+    with db_connection() as conn:
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        # Attempts and everything derived from them go with the user
+        with user_connection(user_id) as shard:
+            for table in _progress_tables(shard) + USER_AGGREGATE_TABLES:
+                shard.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
     return True
 
+# Login sessions (see utils/session_store.py)
+def load_session(token, now=None):
+    """Saved (data, expires_at) row for token, or None if it is unknown or expired."""
+    now = int(time.time()) if now is None else now
+    with db_connection() as conn:
+        return conn.execute("SELECT data, expires_at FROM sessions WHERE token = ? AND expires_at > ?",
+                            (token, now)).fetchone()
+
+def save_sessions(rows):
+    """Upsert (token, user_id, data JSON, expires_at) rows in one transaction."""
+    with db_connection() as conn:
+        conn.executemany("INSERT OR REPLACE INTO sessions (token, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+                         rows)
+
+def delete_sessions(tokens):
+    with db_connection() as conn:
+        conn.executemany("DELETE FROM sessions WHERE token = ?", ((token,) for token in tokens))
+
+def purge_expired_sessions(now=None):
+    """Delete expired sessions; returns how many were removed."""
+    now = int(time.time()) if now is None else now
+    with db_connection() as conn:
+        return conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+
 # Question management functions
+def _normalize_text(text):
+    return ' '.join(unicodedata.normalize('NFKC', text or '').lower().split())
+
+def question_content_hash(question_type, content, options=None, answer=None):
+    """Hash of the normalized question text, used to keep the bank free of duplicates.
+
+    Case, full-/half-width forms and whitespace differences do not change the hash.
+    """
+    payload = '\x1f'.join(_normalize_text(part) for part in (question_type, content, options, answer))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+# Upsert: inserting a question whose content hash already exists is a no-op
+INSERT_QUESTION_SQL = """
+    INSERT INTO questions (question_type, content, options, answer, explanation, difficulty, category, content_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(content_hash) DO NOTHING
+"""
+
 def add_question(question_type, content, answer, difficulty, category, options=None, explanation=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO questions (question_type, content, options, answer, explanation, difficulty, category) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (question_type, content, options, answer, explanation, difficulty, category)
-    )
-    conn.commit()
-    conn.close()
-    return True
+    """Add a question; returns False if an identical question already exists."""
+    content_hash = question_content_hash(question_type, content, options, answer)
+    with db_connection() as conn:
+        cursor = conn.execute(
+            INSERT_QUESTION_SQL,
+            (question_type, content, options, answer, explanation, difficulty, category, content_hash)
+        )
+        added = cursor.rowcount > 0
+    _catalog.invalidate()
+    return added
+
+def _migrate_content_hash(conn):
+    if not _column_exists(conn, 'questions', 'content_hash'):
+        conn.execute("ALTER TABLE questions ADD COLUMN content_hash TEXT")
+    rows = conn.execute(
+        "SELECT id, question_type, content, options, answer FROM questions WHERE content_hash IS NULL"
+    ).fetchall()
+    for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        conn.executemany("UPDATE questions SET content_hash = ? WHERE id = ?", [
+            (question_content_hash(row['question_type'], row['content'], row['options'], row['answer']), row['id'])
+            for row in rows[start:start + IMPORT_CHUNK_SIZE]
+        ])
+    _dedupe_questions(conn)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_content_hash ON questions (content_hash)")
+
+def _dedupe_questions(conn):
+    """Merge questions sharing a content hash into the oldest copy.
+
+    Attempts on the duplicates are re-pointed at the kept question, the
+    affected users' aggregates are rebuilt, and the duplicates are deleted.
+    Returns the number of questions removed.
+    """
+    conn.execute("DROP TABLE IF EXISTS temp.question_remap")
+    conn.execute("CREATE TEMP TABLE question_remap (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+    conn.execute("""
+        INSERT INTO question_remap (old_id, new_id)
+        SELECT q.id, keep.id
+        FROM questions q
+        JOIN (SELECT content_hash, MIN(id) as id FROM questions
+              WHERE content_hash IS NOT NULL GROUP BY content_hash HAVING COUNT(*) > 1) keep
+          ON q.content_hash = keep.content_hash AND q.id <> keep.id
+    """)
+    remap = conn.execute("SELECT old_id, new_id FROM question_remap").fetchall()
+    if remap:
+        for shard in _shard_connections():
+            _remap_attempts(shard, remap)
+        conn.execute("DELETE FROM questions WHERE id IN (SELECT old_id FROM question_remap)")
+    conn.execute("DROP TABLE temp.question_remap")
+    return len(remap)
+
+def _remap_attempts(conn, remap):
+    """Re-point attempts from old to new question ids and rebuild the users affected."""
+    conn.execute("DROP TABLE IF EXISTS temp.attempt_remap")
+    conn.execute("CREATE TEMP TABLE attempt_remap (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+    conn.executemany("INSERT INTO attempt_remap (old_id, new_id) VALUES (?, ?)", [tuple(row) for row in remap])
+    affected_users = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT user_id FROM {_progress_source(conn)} WHERE question_id IN (SELECT old_id FROM attempt_remap)"
+    )]
+    for table in _progress_tables(conn):
+        conn.execute(f"""
+            UPDATE {table}
+            SET question_id = (SELECT new_id FROM attempt_remap WHERE old_id = {table}.question_id)
+            WHERE question_id IN (SELECT old_id FROM attempt_remap)
+        """)
+    for user_id in affected_users:
+        _rebuild_user_aggregates(conn, user_id)
+    conn.execute("DROP TABLE temp.attempt_remap")
+
+def dedupe_questions():
+    """One-off pass that removes duplicate questions from an existing bank."""
+    flush_attempts()
+    with db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # Rows written by older code may not have a hash yet
+        _migrate_content_hash(conn)
+        removed = _dedupe_questions(conn)
+    _catalog.invalidate()
+    return removed
+
+# Question catalog
+# Questions change rarely and are read on every rerun, so the whole bank is
+# kept in memory once per process as immutable records shared by all sessions.
+class QuestionRecord(NamedTuple):
+    """Read-only question row; supports row['column'] access like sqlite3.Row."""
+    id: int
+    question_type: str
+    content: str
+    options: Optional[str]
+    answer: str
+    explanation: Optional[str]
+    difficulty: int
+    category: str
+    created_at: Optional[str]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return self._fields
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+class _CatalogSnapshot(NamedTuple):
+    version: int
+    by_id: dict
+    buckets: dict
+
+class QuestionCatalog:
+    """Process-wide snapshot of the question bank indexed by id, category and difficulty.
+
+    Snapshots are replaced wholesale, never mutated, so readers need no lock.
+    The question_bank_version counter is checked at most every CHECK_INTERVAL
+    seconds; writes made through this module invalidate it immediately.
+    """
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+
+    def reset(self):
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = 0.0
+
+    def invalidate(self):
+        """Force a version check on the next read."""
+        self._checked_at = 0.0
+
+    def _load(self, conn, version):
+        by_id, buckets = {}, {}
+        fields = ', '.join(QuestionRecord._fields)
+        for row in conn.execute(f"SELECT {fields} FROM questions ORDER BY id"):
+            record = QuestionRecord(*row)
+            by_id[record.id] = record
+            # Every filter combination the callers use gets its own list
+            for key in ((record.category, record.difficulty), (record.category, None),
+                        (None, record.difficulty), (None, None)):
+                buckets.setdefault(key, []).append(record)
+        return _CatalogSnapshot(version, by_id, {key: tuple(bucket) for key, bucket in buckets.items()})
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < self.CHECK_INTERVAL:
+            return snapshot
+        version = get_question_bank_version()
+        self._checked_at = now
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                with db_connection() as conn:
+                    self._snapshot = self._load(conn, version)
+            return self._snapshot
+
+    def bucket(self, category=None, difficulty=None):
+        return self.snapshot().buckets.get((category or None, difficulty or None), ())
+
+_catalog = QuestionCatalog()
 
 def get_question_by_id(question_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM questions WHERE id = ?", (question_id,))
-    question = cursor.fetchone()
-    conn.close()
-    return question
+    return _catalog.snapshot().by_id.get(question_id)
 
 def get_questions_by_category(category, limit=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM questions WHERE category = ?"
-    params = [category]
-    
-    if limit:
-        query += " LIMIT ?"
-        params.append(limit)
-        
-    cursor.execute(query, params)
-    questions = cursor.fetchall()
-    conn.close()
-    return questions
+    return list(_catalog.bucket(category=category)[:limit])
 
 def get_questions_by_difficulty(difficulty, limit=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM questions WHERE difficulty = ?"
-    params = [difficulty]
-    
-    if limit:
-        query += " LIMIT ?"
-        params.append(limit)
-        
-    cursor.execute(query, params)
-    questions = cursor.fetchall()
-    conn.close()
-    return questions
+    return list(_catalog.bucket(difficulty=difficulty)[:limit])
+
+def get_question_bank_version():
+    with db_connection() as conn:
+        row = conn.execute("SELECT version FROM question_bank_version WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+def get_questions_by_ids(question_ids):
+    """Look questions up by primary key, preserving the order of question_ids."""
+    by_id = _catalog.snapshot().by_id
+    return [by_id[qid] for qid in question_ids if qid in by_id]
 
 def get_random_questions(limit=10, category=None, difficulty=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM questions"
-    params = []
-    
-    conditions = []
-    if category:
-        conditions.append("category = ?")
-        params.append(category)
-    if difficulty:
-        conditions.append("difficulty = ?")
-        params.append(difficulty)
-        
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
-    
-    query += " ORDER BY RANDOM() LIMIT ?"
-    params.append(limit)
-    
-    cursor.execute(query, params)
-    questions = cursor.fetchall()
-    conn.close()
-    return questions
+    questions = _catalog.bucket(category, difficulty)
+    return random.sample(questions, min(limit, len(questions)))
 
 def update_question(question_id, question_type=None, content=None, options=None, answer=None, explanation=None, difficulty=None, category=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Build update query based on provided parameters
     update_fields = []
     params = []
@@ -254,122 +916,1336 @@ def update_question(question_id, question_type=None, content=None, options=None,
         params.append(category)
     
     if not update_fields:
-        conn.close()
         return False
     
-    params.append(question_id)
-    query = f"UPDATE questions SET {', '.join(update_fields)} WHERE id = ?"
-    
-    cursor.execute(query, params)
-    conn.commit()
-    conn.close()
+    try:
+        with db_connection() as conn:
+            before = conn.execute("SELECT * FROM questions WHERE id = ?", (question_id,)).fetchone()
+            if not before:
+                return False
+            
+            # Keep the content hash in step with the edited text
+            update_fields.append("content_hash = ?")
+            params.append(question_content_hash(
+                question_type or before['question_type'],
+                content or before['content'],
+                options if options is not None else before['options'],
+                answer or before['answer']
+            ))
+            params.append(question_id)
+            query = f"UPDATE questions SET {', '.join(update_fields)} WHERE id = ?"
+            conn.execute(query, params)
+            if ((category and category != before['category'])
+                    or (difficulty and difficulty != before['difficulty'])):
+                _move_question_aggregates(question_id, before['category'], before['difficulty'],
+                                          category or before['category'], difficulty or before['difficulty'])
+    except sqlite3.IntegrityError:
+        # The edit would make it identical to another question
+        return False
+    _catalog.invalidate()
     return True
 
+def _purge_questions(conn, question_ids, chunk_size=DELETE_CHUNK_SIZE):
+    """Delete questions together with their attempts and ledger rows, subtracting
+    those attempts from the statistics tables. Runs inside the caller's transaction
+    (with sharding, each shard commits its part per chunk)."""
+    affected_users = {}
+    for start in range(0, len(question_ids), chunk_size):
+        chunk = question_ids[start:start + chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        
+        for index, shard in enumerate(_shard_connections()):
+            totals, by_category, by_difficulty, by_day = {}, {}, {}, {}
+            for user_id, category, difficulty, day, n, c in shard.execute(f"""
+                SELECT up.user_id, q.category, q.difficulty, up.attempt_day,
+                       COUNT(*), SUM(up.is_correct)
+                FROM {_progress_source(shard)} up JOIN questions q ON q.id = up.question_id
+                WHERE up.question_id IN ({placeholders})
+                GROUP BY up.user_id, q.category, q.difficulty, up.attempt_day
+            """, chunk):
+                _add_counts(totals, user_id, -c, -n)
+                _add_counts(by_category, (user_id, category), -c, -n)
+                _add_counts(by_difficulty, (user_id, difficulty), -c, -n)
+                _add_counts(by_day, (user_id, day), -c, -n)
+            _apply_aggregate_deltas(shard, totals, by_category, by_difficulty, by_day)
+            if _column_exists(shard, 'user_stats_summary', 'answered_questions'):
+                _add_answered_questions(shard, {
+                    user_id: -n for user_id, n in shard.execute(f"""
+                        SELECT user_id, COUNT(DISTINCT question_id) FROM {_progress_source(shard)}
+                        WHERE question_id IN ({placeholders})
+                        GROUP BY user_id
+                    """, chunk)
+                })
+            affected_users.setdefault(index, set()).update(totals)
+            
+            for table in _progress_tables(shard):
+                shard.execute(f"DELETE FROM {table} WHERE question_id IN ({placeholders})", chunk)
+            shard.execute(f"DELETE FROM user_mistakes WHERE question_id IN ({placeholders})", chunk)
+        conn.execute(f"DELETE FROM questions WHERE id IN ({placeholders})", chunk)
+    for index, user_ids in affected_users.items():
+        with shard_connection(index) as shard:
+            _refresh_streaks(shard, user_ids)
+    return len(question_ids)
+
 def delete_question(question_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM questions WHERE id = ?", (question_id,))
-    conn.commit()
-    conn.close()
+    flush_attempts()
+    with db_connection() as conn:
+        _purge_questions(conn, [question_id])
+    _catalog.invalidate()
+    return True
+
+# Full-text search
+def _migrate_question_search(conn):
+    try:
+        # trigram tokenizes CJK text without word boundaries (SQLite 3.34+)
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+                content, options, explanation,
+                content='questions', content_rowid='id', tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        # Left unrecorded and retried on the next start, e.g. after a SQLite upgrade;
+        # search uses LIKE until then
+        raise MigrationDeferred(f"FTS5 trigram 不可用，题目搜索暂时使用 LIKE 查询: {e}")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_questions_fts_insert AFTER INSERT ON questions BEGIN
+            INSERT INTO questions_fts (rowid, content, options, explanation)
+            VALUES (new.id, new.content, new.options, new.explanation);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_questions_fts_delete AFTER DELETE ON questions BEGIN
+            INSERT INTO questions_fts (questions_fts, rowid, content, options, explanation)
+            VALUES ('delete', old.id, old.content, old.options, old.explanation);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_questions_fts_update AFTER UPDATE OF content, options, explanation ON questions BEGIN
+            INSERT INTO questions_fts (questions_fts, rowid, content, options, explanation)
+            VALUES ('delete', old.id, old.content, old.options, old.explanation);
+            INSERT INTO questions_fts (rowid, content, options, explanation)
+            VALUES (new.id, new.content, new.options, new.explanation);
+        END
+    """)
+    conn.execute("INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')")
+
+def _question_filters(category=None, difficulty=None, question_type=None, alias="q"):
+    conditions, params = [], []
+    if category:
+        conditions.append(f"{alias}.category = ?")
+        params.append(category)
+    if difficulty:
+        conditions.append(f"{alias}.difficulty = ?")
+        params.append(difficulty)
+    if question_type:
+        conditions.append(f"{alias}.question_type = ?")
+        params.append(question_type)
+    return conditions, params
+
+def _fts_match_expression(query):
+    """Quote each term as an FTS5 phrase; None if a term is too short for trigrams."""
+    terms = query.split()
+    if not terms or any(len(term) < 3 for term in terms):
+        return None
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+_HIGHLIGHT_START, _HIGHLIGHT_END = '\x02', '\x03'
+
+def _highlight_html(text):
+    # Escape the question text, then turn the private markers into <mark> tags
+    return (html.escape(text or '')
+            .replace(_HIGHLIGHT_START, '<mark>')
+            .replace(_HIGHLIGHT_END, '</mark>'))
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _search_source(query, category, difficulty, question_type):
+    """FROM/WHERE clause and params for a search, plus whether FTS5 is used."""
+    conditions, params = _question_filters(category, difficulty, question_type)
+    match = _fts_match_expression(query)
+    with db_connection() as conn:
+        use_fts = match is not None and _table_exists(conn, 'questions_fts')
+    
+    if use_fts:
+        source = "questions_fts JOIN questions q ON q.id = questions_fts.rowid"
+        conditions.insert(0, "questions_fts MATCH ?")
+        params.insert(0, match)
+    else:
+        # Terms shorter than a trigram (e.g. two-character Chinese words) need a scan
+        source = "questions q"
+        for term in query.split():
+            conditions.append("(q.content LIKE ? ESCAPE '\\' OR q.options LIKE ? ESCAPE '\\' "
+                              "OR q.explanation LIKE ? ESCAPE '\\')")
+            params += ['%' + _escape_like(term) + '%'] * 3
+    where = " AND ".join(conditions) if conditions else "1"
+    return source, where, params, use_fts
+
+def search_questions(query, limit=10, offset=0, category=None, difficulty=None, question_type=None):
+    """One page of questions matching ``query``, best match first.
+
+    Returns dicts with ``id`` and ``highlight`` (HTML-escaped content with
+    matches wrapped in <mark>). Uses the FTS5 trigram index when every term
+    has at least three characters, otherwise falls back to LIKE.
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+    source, where, params, use_fts = _search_source(query, category, difficulty, question_type)
+    if use_fts:
+        columns = f"q.id, highlight(questions_fts, 0, '{_HIGHLIGHT_START}', '{_HIGHLIGHT_END}')"
+        order = "bm25(questions_fts)"
+    else:
+        columns = "q.id, q.content"
+        order = "q.id"
+    with db_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT {columns}
+            FROM {source}
+            WHERE {where}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        """, params + [limit, offset]).fetchall()
+    
+    results = []
+    for question_id, text in rows:
+        if not use_fts:
+            for term in query.split():
+                text = text.replace(term, f"{_HIGHLIGHT_START}{term}{_HIGHLIGHT_END}")
+        results.append({"id": question_id, "highlight": _highlight_html(text)})
+    return results
+
+def count_search_results(query, category=None, difficulty=None, question_type=None):
+    query = (query or '').strip()
+    if not query:
+        return 0
+    source, where, params, _ = _search_source(query, category, difficulty, question_type)
+    with db_connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {source} WHERE {where}", params).fetchone()[0]
+
+# Filtered listing with keyset pagination
+QUESTION_SORTS = {
+    'id': "q.id",
+    'difficulty': "q.difficulty",
+    'category': "q.category",
+}
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+def count_questions(category=None, difficulty=None, question_type=None):
+    """Number of questions matching the filters, cached until the bank changes."""
+    key = (category or None, difficulty or None, question_type or None)
+    version = get_question_bank_version()
+    cached = _count_cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    
+    conditions, params = _question_filters(category, difficulty, question_type)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    with db_connection() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM questions q{where}", params).fetchone()[0]
+    with _count_cache_lock:
+        if len(_count_cache) > 1000:
+            _count_cache.clear()
+        _count_cache[key] = (version, total)
+    return total
+
+def list_questions(category=None, difficulty=None, question_type=None, sort='id', descending=False,
+                   cursor=None, page_size=10):
+    """One page of questions using keyset (seek) pagination.
+
+    Rows are ordered by (sort key, id). ``cursor`` is the ``next_cursor``
+    of the previous page, or None for the first page. Returns a dict with
+    ``rows``, ``next_cursor`` (None on the last page) and the cached ``total``.
+    """
+    sort_column = QUESTION_SORTS[sort]
+    conditions, params = _question_filters(category, difficulty, question_type)
+    direction = "DESC" if descending else "ASC"
+    comparison = "<" if descending else ">"
+    
+    if cursor is not None:
+        # Row-value comparison lets SQLite seek straight to the next page
+        conditions.append(f"({sort_column}, q.id) {comparison} (?, ?)")
+        params += list(cursor)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    
+    with db_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT q.* FROM questions q{where}
+            ORDER BY {sort_column} {direction}, q.id {direction}
+            LIMIT ?
+        """, params + [page_size + 1]).fetchall()
+    
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = (last[sort_column.split('.')[1]], last['id'])
+    
+    return {
+        "rows": rows,
+        "next_cursor": next_cursor,
+        "total": count_questions(category, difficulty, question_type)
+    }
+
+# Category catalog
+# One row per category with counters kept current by triggers on questions, so
+# category lists and per-category summaries never scan the question bank.
+CATEGORY_DIFFICULTY_COLUMNS = {1: 'easy_count', 2: 'medium_count', 3: 'hard_count'}
+CATEGORY_TYPE_COLUMNS = {
+    'multiple_choice': 'multiple_choice_count',
+    'true_false': 'true_false_count',
+    'short_answer': 'short_answer_count',
+}
+
+def _category_delta_sql(row, sign):
+    """UPDATE applying one question row (new/old in a trigger) to its category."""
+    assignments = [
+        f"question_count = question_count {sign} 1",
+        f"difficulty_sum = difficulty_sum {sign} {row}.difficulty",
+    ]
+    for difficulty, column in CATEGORY_DIFFICULTY_COLUMNS.items():
+        assignments.append(f"{column} = {column} {sign} ({row}.difficulty = {difficulty})")
+    for question_type, column in CATEGORY_TYPE_COLUMNS.items():
+        assignments.append(f"{column} = {column} {sign} ({row}.question_type = '{question_type}')")
+    return f"UPDATE categories SET {', '.join(assignments)} WHERE name = {row}.category;"
+
+def _migrate_category_catalog(conn):
+    counters = ['question_count', 'difficulty_sum'] + list(CATEGORY_DIFFICULTY_COLUMNS.values()) \
+        + list(CATEGORY_TYPE_COLUMNS.values())
+    columns = ',\n'.join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in counters)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS categories (
+            name TEXT PRIMARY KEY,
+            {columns},
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_questions_category_insert AFTER INSERT ON questions BEGIN
+            INSERT OR IGNORE INTO categories (name) VALUES (new.category);
+            {_category_delta_sql('new', '+')}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_questions_category_delete AFTER DELETE ON questions BEGIN
+            {_category_delta_sql('old', '-')}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_questions_category_update
+        AFTER UPDATE OF category, difficulty, question_type ON questions BEGIN
+            {_category_delta_sql('old', '-')}
+            INSERT OR IGNORE INTO categories (name) VALUES (new.category);
+            {_category_delta_sql('new', '+')}
+        END
+    """)
+    # Backfill from the existing bank
+    sums = [f"SUM(difficulty = {d})" for d in CATEGORY_DIFFICULTY_COLUMNS] \
+        + [f"SUM(question_type = '{t}')" for t in CATEGORY_TYPE_COLUMNS]
+    conn.execute(f"""
+        INSERT OR REPLACE INTO categories (name, {', '.join(counters)})
+        SELECT category, COUNT(*), SUM(difficulty), {', '.join(sums)}
+        FROM questions GROUP BY category
+    """)
+
+def get_all_categories(include_empty=True):
+    """Category names in creation order; include_empty=False drops categories with no questions."""
+    query = "SELECT name FROM categories"
+    if not include_empty:
+        query += " WHERE question_count > 0"
+    with db_connection() as conn:
+        cursor = conn.execute(query + " ORDER BY rowid")
+        return [row[0] for row in cursor.fetchall()]
+
+def get_category_stats():
+    """Catalog rows with question counts per difficulty and type plus the average difficulty."""
+    with db_connection() as conn:
+        cursor = conn.execute("""
+            SELECT *, CASE WHEN question_count > 0
+                           THEN CAST(difficulty_sum AS REAL) / question_count ELSE 0 END AS avg_difficulty
+            FROM categories ORDER BY rowid
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+
+def add_category(name):
+    """Register an empty category; returns False if it already exists."""
+    with db_connection() as conn:
+        cursor = conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (name,))
+        return cursor.rowcount > 0
+
+def delete_category(category, chunk_size=DELETE_CHUNK_SIZE):
+    """Delete a category, its questions and every attempt on them in one
+    transaction; returns the number of questions removed."""
+    flush_attempts()
+    with db_connection() as conn:
+        question_ids = [row[0] for row in conn.execute("SELECT id FROM questions WHERE category = ?", (category,))]
+        deleted = _purge_questions(conn, question_ids, chunk_size)
+        conn.execute("DELETE FROM categories WHERE name = ?", (category,))
+    _catalog.invalidate()
+    return deleted
+
+# Orphan sweeping
+# Databases from before delete_question cleaned up after itself still hold
+# attempts on deleted questions (and deleted users). Sweep them in short
+# batches so the write lock is released between transactions.
+_sweep_lock = threading.Lock()
+_sweep_status = {"running": False, "deleted": 0, "users": 0, "finished_at": None}
+
+def sweep_orphans(batch_size=DELETE_CHUNK_SIZE, pause=0.0):
+    """Delete attempts (hot and archived) and ledger rows whose question or user no longer exists,
+    then rebuild statistics for the affected users. Returns the number of attempts removed."""
+    flush_attempts()
+    affected_users = set()
+    deleted = 0
+    for index in range(shard_count()):
+        with shard_connection(index) as conn:
+            tables = _progress_tables(conn)
+        for table in tables:
+            last_id = 0
+            while True:
+                # Walk the attempt log in id windows so each batch does bounded work
+                with shard_connection(index) as conn:
+                    window = conn.execute(f"""
+                        SELECT up.id, up.user_id,
+                               EXISTS (SELECT 1 FROM questions q WHERE q.id = up.question_id)
+                               AND EXISTS (SELECT 1 FROM users u WHERE u.id = up.user_id) AS live
+                        FROM {table} up WHERE up.id > ? ORDER BY up.id LIMIT ?
+                    """, (last_id, batch_size)).fetchall()
+                    if not window:
+                        break
+                    orphans = [(row[0], row[1]) for row in window if not row[2]]
+                    conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(row_id,) for row_id, _ in orphans])
+                last_id = window[-1][0]
+                affected_users.update(user_id for _, user_id in orphans)
+                deleted += len(orphans)
+                _sweep_status["deleted"] = deleted
+                if pause and orphans:
+                    time.sleep(pause)
+        
+        with shard_connection(index) as conn:
+            conn.execute("DELETE FROM user_mistakes WHERE question_id NOT IN (SELECT id FROM questions)")
+            for table in USER_AGGREGATE_TABLES:
+                rows = conn.execute(f"SELECT DISTINCT user_id FROM {table} WHERE user_id NOT IN (SELECT id FROM users)")
+                affected_users.update(row[0] for row in rows)
+    for user_id in affected_users:
+        with user_connection(user_id) as conn:
+            _rebuild_user_aggregates(conn, user_id)
+    _sweep_status["users"] = len(affected_users)
+    return deleted
+
+def start_orphan_sweeper(batch_size=DELETE_CHUNK_SIZE, pause=0.05):
+    """Run sweep_orphans on a daemon thread; returns False if a sweep is already running."""
+    if not _sweep_lock.acquire(blocking=False):
+        return False
+    _sweep_status.update(running=True, deleted=0, users=0, finished_at=None)
+    
+    def run():
+        try:
+            sweep_orphans(batch_size, pause)
+        except Exception as e:
+            print(f"清理孤立答题记录失败: {e}")
+        finally:
+            _sweep_status.update(running=False, finished_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+            _sweep_lock.release()
+    
+    threading.Thread(target=run, name="orphan-sweeper", daemon=True).start()
     return True
 
-def get_all_categories():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT category FROM questions")
-    categories = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return categories
+def get_orphan_sweep_status():
+    return dict(_sweep_status)
+
+# Attempt timestamps
+# attempt_ts (UTC epoch seconds) and attempt_day (attempt_ts // 86400) mirror
+# attempt_time so time filters and day grouping are integer range scans.
+# attempt_time stays for display and export.
+ATTEMPT_COLUMNS = "user_id, question_id, is_correct, user_answer, attempt_time, attempt_ts, attempt_day"
+# Unparseable times fall back to 0 so backfilled rows are never revisited
+_EPOCH_SQL = "COALESCE(CAST(strftime('%s', {time}) AS INTEGER), 0)"
+
+def attempt_stamp(now=None):
+    """(attempt_time, attempt_ts, attempt_day) for now, in UTC."""
+    ts = int(now if now is not None else time.time())
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts)), ts, ts // 86400
+
+def _migrate_attempt_timestamps(conn):
+    for table in _progress_tables(conn):
+        for column in ('attempt_ts', 'attempt_day'):
+            if not _column_exists(conn, table, column):
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+        # Rows written without the columns (older code, manual inserts) get them from attempt_time
+        epoch = _EPOCH_SQL.format(time='NEW.attempt_time')
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_stamp AFTER INSERT ON {table}
+            WHEN NEW.attempt_ts IS NULL BEGIN
+                UPDATE {table} SET attempt_ts = {epoch}, attempt_day = {epoch} / 86400 WHERE id = NEW.id;
+            END
+        """)
+        # Partial index over rows the backfill still has to convert; empty once
+        # it is done, so the check on every start costs nothing
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_unstamped ON {table} (id) WHERE attempt_ts IS NULL")
+    # The per-user time indexes move from the text column to the epoch; the
+    # archiver walks the hot table by attempt_ts
+    conn.execute("DROP INDEX IF EXISTS idx_progress_user_time")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_progress_user_ts ON user_progress (user_id, attempt_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_progress_ts ON user_progress (attempt_ts)")
+    _migrate_day_numbers(conn)
+    if _table_exists(conn, 'user_progress_archive'):
+        conn.execute("DROP INDEX IF EXISTS idx_archive_user_time")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_user_ts ON user_progress_archive (user_id, attempt_ts)")
+        conn.execute("DROP VIEW IF EXISTS user_progress_all")
+        conn.execute(f"""
+            CREATE VIEW user_progress_all AS
+            SELECT id, {ATTEMPT_COLUMNS} FROM user_progress
+            UNION ALL
+            SELECT id, {ATTEMPT_COLUMNS} FROM user_progress_archive
+        """)
+
+def _migrate_day_numbers(conn):
+    # The daily rollup and the streak's last active day switch from
+    # 'YYYY-MM-DD' text to day numbers; the tables are rebuilt because a TEXT
+    # column would turn the integers back into strings
+    day_number = "CAST(strftime('%s', {column}) AS INTEGER) / 86400"
+    if _table_exists(conn, 'user_daily_activity'):
+        conn.execute("ALTER TABLE user_daily_activity RENAME TO user_daily_activity_text")
+        conn.execute("""
+            CREATE TABLE user_daily_activity (
+                user_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                correct INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            ) WITHOUT ROWID
+        """)
+        conn.execute(f"""
+            INSERT INTO user_daily_activity (user_id, day, attempts, correct)
+            SELECT user_id, {day_number.format(column='day')}, attempts, correct FROM user_daily_activity_text
+        """)
+        conn.execute("DROP TABLE user_daily_activity_text")
+    if _column_exists(conn, 'user_stats_summary', 'last_active_day'):
+        conn.execute("""
+            CREATE TABLE user_stats_summary_new (
+                user_id INTEGER PRIMARY KEY,
+                total_attempts INTEGER NOT NULL DEFAULT 0,
+                correct_answers INTEGER NOT NULL DEFAULT 0,
+                current_streak INTEGER NOT NULL DEFAULT 0,
+                longest_streak INTEGER NOT NULL DEFAULT 0,
+                last_active_day INTEGER
+            )
+        """)
+        conn.execute(f"""
+            INSERT INTO user_stats_summary_new
+            SELECT user_id, total_attempts, correct_answers, current_streak, longest_streak,
+                   {day_number.format(column='last_active_day')}
+            FROM user_stats_summary
+        """)
+        conn.execute("DROP TABLE user_stats_summary")
+        conn.execute("ALTER TABLE user_stats_summary_new RENAME TO user_stats_summary")
+
+def _migrate_answered_questions(conn):
+    conn.execute("ALTER TABLE user_stats_summary ADD COLUMN answered_questions INTEGER NOT NULL DEFAULT 0")
+    # _store_attempts looks up whether a user has seen a question before in both tables
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_user_question ON user_progress_archive (user_id, question_id)")
+    conn.execute(f"""
+        UPDATE user_stats_summary SET answered_questions = (
+            SELECT COUNT(DISTINCT question_id) FROM {_progress_source(conn)} up
+            WHERE up.user_id = user_stats_summary.user_id
+        )
+    """)
+
+def backfill_attempt_timestamps(batch_size=ARCHIVE_BATCH_SIZE, pause=0.0):
+    """Fill attempt_ts/attempt_day on attempts stored before they existed.
+
+    Walks the unconverted rows of each table in id order through the partial
+    index, one short transaction per batch, so a large history converts
+    without holding the write lock for long and an interrupted run simply
+    resumes. Returns the number of rows converted.
+    """
+    epoch = _EPOCH_SQL.format(time='attempt_time')
+    converted = 0
+    for index in range(shard_count()):
+        with shard_connection(index) as conn:
+            tables = [table for table in _progress_tables(conn)
+                      # ORDER BY id steers the planner to the partial index
+                      if _column_exists(conn, table, 'attempt_ts')
+                      and conn.execute(f"SELECT 1 FROM {table} WHERE attempt_ts IS NULL ORDER BY id LIMIT 1").fetchone()]
+        for table in tables:
+            last_id = 0
+            while True:
+                with shard_connection(index) as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    ids = [row[0] for row in conn.execute(
+                        f"SELECT id FROM {table} WHERE attempt_ts IS NULL AND id > ? ORDER BY id LIMIT ?",
+                        (last_id, batch_size)
+                    )]
+                    if not ids:
+                        break
+                    converted += conn.execute(f"""
+                        UPDATE {table} SET attempt_ts = {epoch}, attempt_day = {epoch} / 86400
+                        WHERE id BETWEEN ? AND ? AND attempt_ts IS NULL
+                    """, (ids[0], ids[-1])).rowcount
+                last_id = ids[-1]
+                if pause:
+                    time.sleep(pause)
+    return converted
 
 # User progress functions
-def record_attempt(user_id, question_id, is_correct, user_answer):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO user_progress (user_id, question_id, is_correct, user_answer) VALUES (?, ?, ?, ?)",
-        (user_id, question_id, is_correct, user_answer)
+def _store_attempts(conn, attempts):
+    """Insert (user_id, question_id, is_correct, user_answer, attempt_time,
+    attempt_ts, attempt_day) rows and fold them into the per-user statistics
+    tables in the same transaction."""
+    first_answers = _count_first_answers(conn, attempts)
+    conn.executemany(f"INSERT INTO user_progress ({ATTEMPT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", attempts)
+    
+    question_ids = list({attempt[1] for attempt in attempts})
+    placeholders = ', '.join('?' * len(question_ids))
+    question_meta = {
+        row[0]: (row[1], row[2])
+        for row in conn.execute(f"SELECT id, category, difficulty FROM questions WHERE id IN ({placeholders})", question_ids)
+    }
+    
+    # Pre-aggregate the batch so each counter row is touched once
+    totals, by_category, by_difficulty, by_day = {}, {}, {}, {}
+    for user_id, question_id, is_correct, _, _, _, attempt_day in attempts:
+        correct = 1 if is_correct else 0
+        _add_counts(totals, user_id, correct)
+        _add_counts(by_day, (user_id, attempt_day), correct)
+        if question_id in question_meta:
+            category, difficulty = question_meta[question_id]
+            _add_counts(by_category, (user_id, category), correct)
+            _add_counts(by_difficulty, (user_id, difficulty), correct)
+    _apply_aggregate_deltas(conn, totals, by_category, by_difficulty, by_day)
+    _add_answered_questions(conn, first_answers)
+    
+    days_by_user = {}
+    for user_id, day in by_day:
+        days_by_user.setdefault(user_id, set()).add(day)
+    _advance_streaks(conn, days_by_user)
+    _update_mistake_ledger(conn, attempts, question_meta)
+
+def _count_first_answers(conn, attempts):
+    """Per user, how many questions in the batch they have never attempted before.
+    Runs before the batch is inserted; each check is one index probe per table."""
+    if not _column_exists(conn, 'user_stats_summary', 'answered_questions'):
+        return {}
+    has_archive = _table_exists(conn, 'user_progress_archive')
+    counts = {}
+    for user_id, question_id in {(attempt[0], attempt[1]) for attempt in attempts}:
+        # is_correct IN (0, 1) lets the lookup use idx_progress_user_correct
+        seen = conn.execute(
+            "SELECT 1 FROM user_progress WHERE user_id = ? AND is_correct IN (0, 1) AND question_id = ? LIMIT 1",
+            (user_id, question_id)
+        ).fetchone()
+        if seen is None and has_archive:
+            seen = conn.execute(
+                "SELECT 1 FROM user_progress_archive WHERE user_id = ? AND question_id = ? LIMIT 1",
+                (user_id, question_id)
+            ).fetchone()
+        if seen is None:
+            counts[user_id] = counts.get(user_id, 0) + 1
+    return counts
+
+def _add_answered_questions(conn, deltas):
+    """Add per-user deltas (may be negative) to the distinct answered question count."""
+    conn.executemany(
+        "UPDATE user_stats_summary SET answered_questions = answered_questions + ? WHERE user_id = ?",
+        [(delta, user_id) for user_id, delta in deltas.items() if delta]
     )
-    conn.commit()
-    conn.close()
+
+def _update_mistake_ledger(conn, attempts, question_meta):
+    # Collapse the batch to one change per (user, question), in submission order
+    changes = {}
+    for user_id, question_id, is_correct, user_answer, attempt_time, _, _ in attempts:
+        change = changes.setdefault((user_id, question_id), {'wrong': 0, 'answer': None, 'time': None})
+        if is_correct:
+            change['resolved'] = 1
+        else:
+            change.update(wrong=change['wrong'] + 1, answer=user_answer, time=attempt_time, resolved=0)
+    
+    wrong_rows, resolved_keys = [], []
+    for (user_id, question_id), change in changes.items():
+        if change['wrong']:
+            category, difficulty = question_meta.get(question_id, (None, None))
+            wrong_rows.append((user_id, question_id, category, difficulty, change['wrong'],
+                               change['answer'], change['time'], change['resolved']))
+        else:
+            resolved_keys.append((user_id, question_id))
+    
+    conn.executemany("""
+        INSERT INTO user_mistakes (user_id, question_id, category, difficulty, wrong_count,
+                                   last_wrong_answer, last_wrong_time, resolved)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, question_id) DO UPDATE SET
+            wrong_count = wrong_count + excluded.wrong_count,
+            last_wrong_answer = excluded.last_wrong_answer,
+            last_wrong_time = excluded.last_wrong_time,
+            resolved = excluded.resolved
+    """, wrong_rows)
+    conn.executemany("UPDATE user_mistakes SET resolved = 1 WHERE user_id = ? AND question_id = ?", resolved_keys)
+
+def _add_counts(counters, key, correct, attempts=1):
+    counts = counters.setdefault(key, [0, 0])
+    counts[0] += attempts
+    counts[1] += correct
+
+def _apply_aggregate_deltas(conn, totals, by_category, by_difficulty, by_day=None):
+    """Add (attempts, correct) deltas to the statistics tables; deltas may be negative."""
+    conn.executemany("""
+        INSERT INTO user_stats_summary (user_id, total_attempts, correct_answers) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            total_attempts = total_attempts + excluded.total_attempts,
+            correct_answers = correct_answers + excluded.correct_answers
+    """, [(user_id, n, c) for user_id, (n, c) in totals.items()])
+    conn.executemany("""
+        INSERT INTO user_category_stats (user_id, category, attempts, correct) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, category) DO UPDATE SET
+            attempts = attempts + excluded.attempts,
+            correct = correct + excluded.correct
+    """, [(user_id, category, n, c) for (user_id, category), (n, c) in by_category.items()])
+    conn.executemany("""
+        INSERT INTO user_difficulty_stats (user_id, difficulty, attempts, correct) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, difficulty) DO UPDATE SET
+            attempts = attempts + excluded.attempts,
+            correct = correct + excluded.correct
+    """, [(user_id, difficulty, n, c) for (user_id, difficulty), (n, c) in by_difficulty.items()])
+    if by_day:
+        conn.executemany("""
+            INSERT INTO user_daily_activity (user_id, day, attempts, correct) VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id, day) DO UPDATE SET
+                attempts = attempts + excluded.attempts,
+                correct = correct + excluded.correct
+        """, [(user_id, day, n, c) for (user_id, day), (n, c) in by_day.items()])
+    # Counters that dropped to zero carry no information
+    conn.executemany("DELETE FROM user_category_stats WHERE user_id = ? AND category = ? AND attempts <= 0",
+                     [key for key, (n, _) in by_category.items() if n < 0])
+    conn.executemany("DELETE FROM user_difficulty_stats WHERE user_id = ? AND difficulty = ? AND attempts <= 0",
+                     [key for key, (n, _) in by_difficulty.items() if n < 0])
+    if by_day:
+        conn.executemany("DELETE FROM user_daily_activity WHERE user_id = ? AND day = ? AND attempts <= 0",
+                         [key for key, (n, _) in by_day.items() if n < 0])
+
+def _utc_day_number():
+    # Day numbers count UTC days since the epoch, like attempt_day
+    return int(time.time()) // 86400
+
+def _previous_day(day):
+    # Migrations before 16 still rebuild streaks from 'YYYY-MM-DD' text
+    if isinstance(day, str):
+        return (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+    return day - 1
+
+def _advance_streaks(conn, days_by_user):
+    """Extend each user's streak with newly active days (day numbers)."""
+    for user_id, days in days_by_user.items():
+        row = conn.execute(
+            "SELECT current_streak, longest_streak, last_active_day FROM user_stats_summary WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        streak, longest, last_day = (row[0], row[1], row[2]) if row else (0, 0, None)
+        for day in sorted(days):
+            if last_day is not None and day <= last_day:
+                continue
+            streak = streak + 1 if last_day is not None and _previous_day(day) == last_day else 1
+            longest = max(longest, streak)
+            last_day = day
+        conn.execute(
+            "UPDATE user_stats_summary SET current_streak = ?, longest_streak = ?, last_active_day = ? WHERE user_id = ?",
+            (streak, longest, last_day, user_id)
+        )
+
+def _rebuild_streaks(conn, user_id=None):
+    where = "WHERE user_id = ?" if user_id is not None else ""
+    params = (user_id,) if user_id is not None else ()
+    streaks = {}
+    for uid, day in conn.execute(f"SELECT user_id, day FROM user_daily_activity {where} ORDER BY user_id, day", params):
+        streak, longest, last_day = streaks.get(uid, (0, 0, None))
+        streak = streak + 1 if last_day is not None and _previous_day(day) == last_day else 1
+        streaks[uid] = (streak, max(longest, streak), day)
+    conn.executemany(
+        "UPDATE user_stats_summary SET current_streak = ?, longest_streak = ?, last_active_day = ? WHERE user_id = ?",
+        [(streak, longest, last_day, uid) for uid, (streak, longest, last_day) in streaks.items()]
+    )
+
+def _refresh_streaks(conn, user_ids):
+    """Recompute streaks for users whose daily activity lost rows."""
+    conn.executemany(
+        "UPDATE user_stats_summary SET current_streak = 0, longest_streak = 0, last_active_day = NULL WHERE user_id = ?",
+        [(user_id,) for user_id in user_ids]
+    )
+    for user_id in user_ids:
+        _rebuild_streaks(conn, user_id)
+
+def _move_question_aggregates(question_id, old_category, old_difficulty, new_category, new_difficulty):
+    """Re-file a question's attempts after its category or difficulty changed."""
+    for conn in _shard_connections():
+        by_category, by_difficulty = {}, {}
+        for user_id, n, c in conn.execute(
+            f"SELECT user_id, COUNT(*), SUM(is_correct) FROM {_progress_source(conn)} WHERE question_id = ? GROUP BY user_id",
+            (question_id,)
+        ):
+            if old_category != new_category:
+                _add_counts(by_category, (user_id, old_category), -c, -n)
+                _add_counts(by_category, (user_id, new_category), c, n)
+            if old_difficulty != new_difficulty:
+                _add_counts(by_difficulty, (user_id, old_difficulty), -c, -n)
+                _add_counts(by_difficulty, (user_id, new_difficulty), c, n)
+        _apply_aggregate_deltas(conn, {}, by_category, by_difficulty)
+        conn.execute("UPDATE user_mistakes SET category = ?, difficulty = ? WHERE question_id = ?",
+                     (new_category, new_difficulty, question_id))
+
+# Tables derived from user_progress, keyed by user_id
+USER_AGGREGATE_TABLES = ('user_stats_summary', 'user_category_stats', 'user_difficulty_stats',
+                         'user_daily_activity', 'user_mistakes')
+
+def _rebuild_user_aggregates(conn, user_id=None):
+    """Recompute the statistics tables from every attempt, hot and archived (all users or one)."""
+    progress = _progress_source(conn)
+    where = "WHERE up.user_id = ?" if user_id is not None else ""
+    params = (user_id,) if user_id is not None else ()
+    
+    # Earlier migrations call this before later tables exist
+    tables = [table for table in USER_AGGREGATE_TABLES if _table_exists(conn, table)]
+    for table in tables:
+        conn.execute(f"DELETE FROM {table} {where.replace('up.', '')}", params)
+    
+    # Migrations before 18 rebuild without the distinct question count
+    if _column_exists(conn, 'user_stats_summary', 'answered_questions'):
+        columns, answered = ", answered_questions", ", COUNT(DISTINCT up.question_id)"
+    else:
+        columns = answered = ""
+    conn.execute(f"""
+        INSERT INTO user_stats_summary (user_id, total_attempts, correct_answers{columns})
+        SELECT up.user_id, COUNT(*), SUM(up.is_correct){answered}
+        FROM {progress} up {where}
+        GROUP BY up.user_id
+    """, params)
+    conn.execute(f"""
+        INSERT INTO user_category_stats (user_id, category, attempts, correct)
+        SELECT up.user_id, q.category, COUNT(*), SUM(up.is_correct)
+        FROM {progress} up JOIN questions q ON up.question_id = q.id {where}
+        GROUP BY up.user_id, q.category
+    """, params)
+    conn.execute(f"""
+        INSERT INTO user_difficulty_stats (user_id, difficulty, attempts, correct)
+        SELECT up.user_id, q.difficulty, COUNT(*), SUM(up.is_correct)
+        FROM {progress} up JOIN questions q ON up.question_id = q.id {where}
+        GROUP BY up.user_id, q.difficulty
+    """, params)
+    if 'user_daily_activity' in tables:
+        # Day numbers from migration 16 on (rows the backfill has not reached
+        # yet are converted here); migrations before it still use the text date
+        if _column_exists(conn, progress, 'attempt_day'):
+            day = f"COALESCE(up.attempt_day, {_EPOCH_SQL.format(time='up.attempt_time')} / 86400)"
+        else:
+            day = "DATE(up.attempt_time)"
+        conn.execute(f"""
+            INSERT INTO user_daily_activity (user_id, day, attempts, correct)
+            SELECT up.user_id, {day}, COUNT(*), SUM(up.is_correct)
+            FROM {progress} up {where}
+            GROUP BY up.user_id, {day}
+        """, params)
+        _rebuild_streaks(conn, user_id)
+    if 'user_mistakes' in tables:
+        conn.execute(f"""
+            INSERT INTO user_mistakes (user_id, question_id, category, difficulty, wrong_count,
+                                       last_wrong_answer, last_wrong_time, resolved)
+            SELECT w.user_id, w.question_id, q.category, q.difficulty, w.wrong_count,
+                   last.user_answer, last.attempt_time,
+                   EXISTS (SELECT 1 FROM {progress} c
+                           WHERE c.user_id = w.user_id AND c.is_correct = 1
+                             AND c.question_id = w.question_id AND c.id > w.last_wrong_id)
+            FROM (
+                SELECT up.user_id, up.question_id, COUNT(*) as wrong_count, MAX(up.id) as last_wrong_id
+                FROM {progress} up {where} {"AND" if where else "WHERE"} up.is_correct = 0
+                GROUP BY up.user_id, up.question_id
+            ) w
+            JOIN {progress} last ON last.id = w.last_wrong_id
+            JOIN questions q ON q.id = w.question_id
+        """, params)
+
+def split_into_shards(batch_size=ARCHIVE_BATCH_SIZE):
+    """Move attempts recorded before sharding was enabled out of the catalog and
+    into their users' shards, keeping attempt ids, then rebuild the shards'
+    statistics. Returns the number of attempts moved."""
+    if not SHARD_COUNT:
+        return 0
+    flush_attempts()
+    moved = 0
+    max_id = 0
+    with db_connection() as conn:
+        tables = _progress_tables(conn)
+    for table in tables:
+        while True:
+            with db_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # The catalog copy may predate attempt_ts; the shard's insert trigger fills it in
+                rows = conn.execute(f"""
+                    SELECT id, user_id, question_id, is_correct, user_answer, attempt_time
+                    FROM {table} ORDER BY id LIMIT ?
+                """, (batch_size,)).fetchall()
+                if not rows:
+                    break
+                by_shard = {}
+                for row in rows:
+                    by_shard.setdefault(shard_for_user(row['user_id']), []).append(tuple(row))
+                # Shard rows are committed before the catalog copy is dropped, so a
+                # crash in between leaves duplicates that the next run overwrites
+                for index, shard_rows in by_shard.items():
+                    with shard_connection(index) as shard:
+                        shard.executemany(f"""
+                            INSERT OR REPLACE INTO {table} (id, user_id, question_id, is_correct, user_answer, attempt_time)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        """, shard_rows)
+                conn.execute(f"DELETE FROM {table} WHERE id <= ?", (rows[-1]['id'],))
+            moved += len(rows)
+            max_id = max(max_id, rows[-1]['id'])
+    # Moved ids came from one sequence; keep new ids in every shard above them
+    for conn in _shard_connections():
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'user_progress'", (max_id,))
+    with db_connection() as conn:
+        for table in USER_AGGREGATE_TABLES:
+            if _table_exists(conn, table):
+                conn.execute(f"DELETE FROM {table}")
+    rebuild_user_stats()
+    return moved
+
+def rebuild_user_stats(user_id=None):
+    """Recompute the materialized statistics if they ever drift from user_progress."""
+    flush_attempts(user_id=user_id)
+    if user_id is not None:
+        with user_connection(user_id) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            _rebuild_user_aggregates(conn, user_id)
+        return True
+    for index in range(shard_count()):
+        with shard_connection(index) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            _rebuild_user_aggregates(conn)
+    return True
+
+class AttemptWriter:
+    """Write-behind recorder for user attempts.
+
+    Callers enqueue attempts into a bounded queue and return immediately; a
+    single background thread drains the queue and group-commits batches in one
+    transaction. Every submission gets a sequence number, and wait_for()/flush()
+    block until that sequence has been processed for read-your-writes callers.
+    An attempt that cannot be written is logged and marked failed, so its
+    waiters are released with False instead of hanging.
+    """
+
+    _STOP = object()
+
+    def __init__(self, shard=0, batch_size=ATTEMPT_BATCH_SIZE, flush_interval=ATTEMPT_FLUSH_INTERVAL,
+                 max_queue=ATTEMPT_QUEUE_SIZE):
+        self.shard = shard
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._submit_lock = threading.Lock()
+        self._committed_cond = threading.Condition()
+        self._submitted = 0
+        self._committed = 0
+        # user_id -> last seq submitted for that user, while it is still pending
+        self._user_seqs = {}
+        # seq -> None, oldest first, bounded by ATTEMPT_FAILED_KEEP
+        self._failed = {}
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._submit_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name=f"attempt-writer-{self.shard}",
+                                                    daemon=True)
+                    self._thread.start()
+
+    def submit(self, user_id, question_id, is_correct, user_answer):
+        """Queue one attempt and return its sequence number.
+
+        Blocks only when the queue is full, which applies back-pressure
+        instead of dropping answers.
+        """
+        self._ensure_started()
+        # Stamp the time now (UTC, like CURRENT_TIMESTAMP) rather than at commit
+        stamp = attempt_stamp()
+        with self._submit_lock:
+            self._submitted += 1
+            seq = self._submitted
+            self._user_seqs[user_id] = seq
+            self._queue.put((seq, (user_id, question_id, is_correct, user_answer) + stamp))
+        return seq
+
+    def wait_for(self, seq, timeout=None):
+        """Block until attempt ``seq`` is processed; False on timeout or if it failed."""
+        with self._committed_cond:
+            if not self._committed_cond.wait_for(lambda: self._committed >= seq, timeout):
+                return False
+            return seq not in self._failed
+
+    def wait_for_user(self, user_id, timeout=None):
+        """Block until everything submitted so far for one user is processed."""
+        seq = self._user_seqs.get(user_id)
+        return True if seq is None else self.wait_for(seq, timeout)
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is processed."""
+        return self.wait_for(self._submitted, timeout)
+
+    def close(self, timeout=10):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, items):
+        """Store (seq, attempt) items; returns the seqs that could not be written.
+
+        Any exception is caught: if it escaped, the writer thread would die and
+        every later wait_for() would block forever.
+        """
+        try:
+            with shard_connection(self.shard) as conn:
+                _store_attempts(conn, [attempt for _, attempt in items])
+            return []
+        except sqlite3.OperationalError as e:
+            # Locked or unavailable database: every row would wait out the busy
+            # timeout again, so the whole batch fails at once
+            print(f"批量写入答题记录失败: {e}")
+            return [seq for seq, _ in items]
+        except Exception as e:
+            # Retry one by one so a single bad row does not lose the whole batch
+            print(f"批量写入答题记录失败，逐条重试: {e}")
+        failed = []
+        deadline = time.monotonic() + ATTEMPT_RETRY_SECONDS
+        for index, (seq, attempt) in enumerate(items):
+            if time.monotonic() >= deadline:
+                print(f"逐条重试超时，{len(items) - index} 条答题记录未写入")
+                failed.extend(seq for seq, _ in items[index:])
+                break
+            try:
+                with shard_connection(self.shard) as conn:
+                    _store_attempts(conn, [attempt])
+            except sqlite3.OperationalError as e:
+                print(f"写入答题记录失败: {e}")
+                failed.extend(seq for seq, _ in items[index:])
+                break
+            except Exception as e:
+                print(f"写入答题记录失败 {attempt}: {e}")
+                failed.append(seq)
+        return failed
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            stop = batch[-1] is self._STOP
+            items = [item for item in batch if item is not self._STOP]
+            if items:
+                failed = self._write(items)
+                with self._submit_lock:
+                    # Forget users with nothing left in the queue
+                    for seq, attempt in items:
+                        if self._user_seqs.get(attempt[0]) == seq:
+                            del self._user_seqs[attempt[0]]
+                with self._committed_cond:
+                    for seq in failed:
+                        self._failed[seq] = None
+                    while len(self._failed) > ATTEMPT_FAILED_KEEP:
+                        del self._failed[next(iter(self._failed))]
+                    self._committed = max(self._committed, items[-1][0])
+                    self._committed_cond.notify_all()
+            if stop:
+                return
+
+# One writer per shard, so shards commit in parallel
+_attempt_writers = {}
+_attempt_writers_lock = threading.Lock()
+
+def _get_attempt_writer(shard):
+    writer = _attempt_writers.get(shard)
+    if writer is None:
+        with _attempt_writers_lock:
+            writer = _attempt_writers.get(shard)
+            if writer is None:
+                writer = _attempt_writers[shard] = AttemptWriter(shard)
+    return writer
+
+def _close_attempt_writers():
+    for writer in list(_attempt_writers.values()):
+        writer.close()
+
+atexit.register(_close_attempt_writers)
+
+def record_attempt(user_id, question_id, is_correct, user_answer, wait=False):
+    """Queue an attempt for the background writer; wait=True blocks until it is
+    written and returns False if writing it failed."""
+    writer = _get_attempt_writer(shard_for_user(user_id))
+    seq = writer.submit(user_id, question_id, is_correct, user_answer)
+    if wait:
+        return writer.wait_for(seq)
     return True
 
-def get_user_progress(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
+def flush_attempts(timeout=None, user_id=None):
+    """Wait until queued attempts are committed (read-your-writes).
+
+    With user_id only that user's attempts are waited for, so a page read is
+    not held up by everyone else's answers; admin and aggregate paths flush
+    the whole queue.
+    """
+    if user_id is not None:
+        writer = _attempt_writers.get(shard_for_user(user_id))
+        return writer is None or writer.wait_for_user(user_id, timeout)
+    return all([writer.flush(timeout) for writer in list(_attempt_writers.values())])
+
+def get_user_progress(user_id, include_archive=False, limit=None):
+    """Attempts joined with their questions, newest first. Only the hot log is
+    read unless include_archive is set."""
+    flush_attempts(user_id=user_id)
+    with user_connection(user_id) as conn:
+        if include_archive and limit and _table_exists(conn, 'user_progress_archive'):
+            # Archived attempts are all older than the hot ones, so the archive
+            # is only read when the hot log has fewer than limit rows
+            rows = _select_user_progress(conn, 'user_progress', user_id, limit)
+            if len(rows) < limit:
+                rows += _select_user_progress(conn, 'user_progress_archive', user_id, limit - len(rows))
+            return rows
+        source = _progress_source(conn) if include_archive else 'user_progress'
+        return _select_user_progress(conn, source, user_id, limit)
+
+def _select_user_progress(conn, source, user_id, limit=None):
+    query = f"""
         SELECT q.id, q.question_type, q.content, q.category, q.difficulty, 
                up.is_correct, up.user_answer, up.attempt_time
-        FROM user_progress up
+        FROM {source} up
         JOIN questions q ON up.question_id = q.id
         WHERE up.user_id = ?
-        ORDER BY up.attempt_time DESC
-    """, (user_id,))
-    progress = cursor.fetchall()
-    conn.close()
-    return progress
-
-def get_user_wrong_questions(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT q.*, up.user_answer, up.attempt_time
-        FROM questions q
-        JOIN user_progress up ON q.id = up.question_id
-        WHERE up.user_id = ? AND up.is_correct = 0
-        GROUP BY q.id
-        ORDER BY up.attempt_time DESC
-    """, (user_id,))
-    wrong_questions = cursor.fetchall()
-    conn.close()
-    return wrong_questions
+        ORDER BY up.attempt_ts DESC
+    """
+    params = [user_id]
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(query, params).fetchall()
+
+def count_answered_questions(user_id):
+    """Distinct questions a user has attempted, including archived attempts
+    (maintained in user_stats_summary as attempts are written)."""
+    flush_attempts(user_id=user_id)
+    with user_connection(user_id) as conn:
+        row = conn.execute("SELECT answered_questions FROM user_stats_summary WHERE user_id = ?",
+                           (user_id,)).fetchone()
+        return row[0] if row else 0
+
+# Hot/cold archival
+# Statistics are folded in when attempts are written, so archiving only moves
+# rows: user_progress keeps the recent window the UI reads, and the
+# user_progress_all view still answers full-history queries.
+def archive_attempts(horizon_days=ARCHIVE_HORIZON_DAYS, batch_size=ARCHIVE_BATCH_SIZE, pause=0.0):
+    """Move attempts older than horizon_days into user_progress_archive, one
+    short transaction per batch. Returns the number of rows moved."""
+    flush_attempts()
+    cutoff = int(time.time()) - horizon_days * 86400
+    moved = 0
+    for index in range(shard_count()):
+        while True:
+            with shard_connection(index) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # A range scan on idx_progress_ts: each batch, and the final empty one,
+                # only touches the rows it moves
+                ids = [row[0] for row in conn.execute(
+                    "SELECT id FROM user_progress WHERE attempt_ts < ? ORDER BY attempt_ts, id LIMIT ?",
+                    (cutoff, batch_size)
+                )]
+                if not ids:
+                    break
+                placeholders = ','.join('?' * len(ids))
+                conn.execute(f"""
+                    INSERT OR REPLACE INTO user_progress_archive (id, {ATTEMPT_COLUMNS})
+                    SELECT id, {ATTEMPT_COLUMNS}
+                    FROM user_progress WHERE id IN ({placeholders})
+                """, ids)
+                conn.execute(f"DELETE FROM user_progress WHERE id IN ({placeholders})", ids)
+            moved += len(ids)
+            if pause:
+                time.sleep(pause)
+    return moved
+
+def get_archive_status():
+    """Row counts and time range of the hot and archived attempt tables (summed over shards)."""
+    status = {}
+    for conn in _shard_connections():
+        for table in ('user_progress', 'user_progress_archive'):
+            row = conn.execute(f"SELECT COUNT(*), MIN(attempt_time), MAX(attempt_time) FROM {table}").fetchone()
+            entry = status.setdefault(table, {"rows": 0, "oldest": None, "newest": None})
+            entry["rows"] += row[0]
+            if row[1] and (entry["oldest"] is None or row[1] < entry["oldest"]):
+                entry["oldest"] = row[1]
+            if row[2] and (entry["newest"] is None or row[2] > entry["newest"]):
+                entry["newest"] = row[2]
+    return status
+
+def iter_user_attempts(user_id, include_archive=True, batch_size=EXPORT_BATCH_SIZE):
+    """Yield one user's attempts joined with their questions, oldest first.
+
+    Rows are pulled with fetchmany, archive then hot log, each in
+    (user_id, attempt_ts) index order, so memory does not depend on
+    how long the history is.
+    """
+    flush_attempts(user_id=user_id)
+    with user_connection(user_id) as conn:
+        tables = _progress_tables(conn)[::-1] if include_archive else ('user_progress',)
+        for table in tables:
+            cursor = conn.execute(f"""
+                SELECT q.id, q.question_type, q.content, q.category, q.difficulty,
+                       up.is_correct, up.user_answer, up.attempt_time
+                FROM {table} up
+                JOIN questions q ON up.question_id = q.id
+                WHERE up.user_id = ?
+                ORDER BY up.attempt_ts
+            """, (user_id,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+def iter_attempt_history(after_id=0, batch_size=EXPORT_BATCH_SIZE, shard=0):
+    """Yield batches of one shard's attempts with id > after_id joined with
+    question metadata.
+
+    Archived attempts come first, then the hot log, each in id order. Every
+    batch is its own short keyset read, so a long export never pins a read
+    transaction (and the WAL) on the live database.
+    """
+    flush_attempts()
+    with shard_connection(shard) as conn:
+        tables = _progress_tables(conn)[::-1]
+    for table in tables:
+        last_id = after_id
+        while True:
+            with shard_connection(shard) as conn:
+                rows = conn.execute(f"""
+                    SELECT up.id AS attempt_id, up.user_id, up.question_id, up.is_correct,
+                           up.user_answer, up.attempt_time, up.attempt_ts, q.category, q.difficulty, q.question_type
+                    FROM {table} up JOIN questions q ON q.id = up.question_id
+                    WHERE up.id > ? ORDER BY up.id LIMIT ?
+                """, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1]['attempt_id']
+
+# Sort orders for the mistake ledger; each is backed by a (user_id, ...) index
+WRONG_QUESTION_SORTS = {
+    'recent': "m.last_wrong_time DESC",
+    'difficulty_asc': "m.difficulty ASC, m.last_wrong_time DESC",
+    'difficulty_desc': "m.difficulty DESC, m.last_wrong_time DESC",
+}
+
+def _mistake_filters(user_id, category, include_resolved):
+    conditions = ["m.user_id = ?"]
+    params = [user_id]
+    if category:
+        conditions.append("m.category = ?")
+        params.append(category)
+    if not include_resolved:
+        conditions.append("m.resolved = 0")
+    return " AND ".join(conditions), params
+
+def get_user_wrong_questions(user_id, category=None, sort='recent', limit=None, offset=0, include_resolved=True):
+    """One page of the user's mistake ledger joined with the questions.
+
+    Rows carry the question columns plus user_answer / attempt_time (of the
+    latest wrong attempt), wrong_count and resolved.
+    """
+    flush_attempts(user_id=user_id)
+    where, params = _mistake_filters(user_id, category, include_resolved)
+    query = f"""
+        SELECT q.*, m.last_wrong_answer as user_answer, m.last_wrong_time as attempt_time,
+               m.wrong_count, m.resolved
+        FROM user_mistakes m
+        JOIN questions q ON q.id = m.question_id
+        WHERE {where}
+        ORDER BY {WRONG_QUESTION_SORTS[sort]}
+    """
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    with user_connection(user_id) as conn:
+        return conn.execute(query, params).fetchall()
+
+def count_user_wrong_questions(user_id, category=None, include_resolved=True):
+    flush_attempts(user_id=user_id)
+    where, params = _mistake_filters(user_id, category, include_resolved)
+    with user_connection(user_id) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM user_mistakes m WHERE {where}", params).fetchone()[0]
+
+def get_user_wrong_category_counts(user_id, include_resolved=True):
+    """(category, count) rows for the user's ledger."""
+    flush_attempts(user_id=user_id)
+    where, params = _mistake_filters(user_id, None, include_resolved)
+    with user_connection(user_id) as conn:
+        return conn.execute(f"""
+            SELECT m.category, COUNT(*) as count
+            FROM user_mistakes m
+            WHERE {where}
+            GROUP BY m.category
+            ORDER BY count DESC
+        """, params).fetchall()
 
 def get_user_stats(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Total attempts
-    cursor.execute("SELECT COUNT(*) FROM user_progress WHERE user_id = ?", (user_id,))
-    total_attempts = cursor.fetchone()[0]
-    
-    # Correct answers
-    cursor.execute("SELECT COUNT(*) FROM user_progress WHERE user_id = ? AND is_correct = 1", (user_id,))
-    correct_answers = cursor.fetchone()[0]
-    
-    # Accuracy rate
-    accuracy = (correct_answers / total_attempts * 100) if total_attempts > 0 else 0
-    
-    # Questions by category
-    cursor.execute("""
-        SELECT q.category, COUNT(*) as count, SUM(up.is_correct) as correct
-        FROM user_progress up
-        JOIN questions q ON up.question_id = q.id
-        WHERE up.user_id = ?
-        GROUP BY q.category
-    """, (user_id,))
-    category_stats = cursor.fetchall()
-    
-    # Questions by difficulty
-    cursor.execute("""
-        SELECT q.difficulty, COUNT(*) as count, SUM(up.is_correct) as correct
-        FROM user_progress up
-        JOIN questions q ON up.question_id = q.id
-        WHERE up.user_id = ?
-        GROUP BY q.difficulty
-    """, (user_id,))
-    difficulty_stats = cursor.fetchall()
-    
-    # Daily progress
-    cursor.execute("""
-        SELECT DATE(attempt_time) as date, COUNT(*) as attempts, SUM(is_correct) as correct
-        FROM user_progress
-        WHERE user_id = ?
-        GROUP BY DATE(attempt_time)
-        ORDER BY date DESC
-        LIMIT 30
-    """, (user_id,))
-    daily_progress = cursor.fetchall()
-    
-    conn.close()
+    flush_attempts(user_id=user_id)
+    with user_connection(user_id) as conn:
+        cursor = conn.cursor()
+        
+        # Totals come from the materialized summary row
+        cursor.execute("SELECT * FROM user_stats_summary WHERE user_id = ?", (user_id,))
+        summary = cursor.fetchone()
+        total_attempts = summary['total_attempts'] if summary else 0
+        correct_answers = summary['correct_answers'] if summary else 0
+        
+        # Accuracy rate
+        accuracy = (correct_answers / total_attempts * 100) if total_attempts > 0 else 0
+        
+        # Questions by category
+        cursor.execute("""
+            SELECT category, attempts as count, correct
+            FROM user_category_stats
+            WHERE user_id = ?
+        """, (user_id,))
+        category_stats = cursor.fetchall()
+        
+        # Questions by difficulty
+        cursor.execute("""
+            SELECT difficulty, attempts as count, correct
+            FROM user_difficulty_stats
+            WHERE user_id = ?
+        """, (user_id,))
+        difficulty_stats = cursor.fetchall()
+        
+        # Daily progress from the rollup table (most recent 30 active days)
+        cursor.execute("""
+            SELECT DATE(day * 86400, 'unixepoch') as date, attempts, correct
+            FROM user_daily_activity
+            WHERE user_id = ?
+            ORDER BY day DESC
+            LIMIT 30
+        """, (user_id,))
+        daily_progress = cursor.fetchall()
     
     return {
         "total_attempts": total_attempts,
@@ -377,75 +2253,256 @@ def get_user_stats(user_id):
         "accuracy": accuracy,
         "category_stats": category_stats,
         "difficulty_stats": difficulty_stats,
-        "daily_progress": daily_progress
+        "daily_progress": daily_progress,
+        "answered_questions": summary['answered_questions'] if summary else 0,
+        "streak": _current_streak(summary),
+        "longest_streak": summary['longest_streak'] if summary else 0
     }
 
+def _current_streak(summary):
+    # A streak is still alive if the user was active today or yesterday
+    if not summary or not summary['last_active_day']:
+        return 0
+    if summary['last_active_day'] >= _utc_day_number() - 1:
+        return summary['current_streak']
+    return 0
+
+def get_user_streak(user_id):
+    flush_attempts(user_id=user_id)
+    with user_connection(user_id) as conn:
+        summary = conn.execute(
+            "SELECT current_streak, last_active_day FROM user_stats_summary WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    return _current_streak(summary)
+
+def get_user_activity_calendar(user_id, days=365):
+    """Daily (date, attempts, correct) rows for the last ``days`` UTC days, oldest first."""
+    flush_attempts(user_id=user_id)
+    start = _utc_day_number() - (days - 1)
+    with user_connection(user_id) as conn:
+        cursor = conn.execute("""
+            SELECT DATE(day * 86400, 'unixepoch') as date, attempts, correct
+            FROM user_daily_activity
+            WHERE user_id = ? AND day >= ?
+            ORDER BY day
+        """, (user_id, start))
+        return cursor.fetchall()
+
 # Import questions from text files
+def bulk_import_questions(questions, category=None, difficulty=2, chunk_size=IMPORT_CHUNK_SIZE):
+    """Insert parsed questions in a single transaction.
+
+    ``questions`` is any iterable of dicts shaped like utils.question_parser
+    output; a question's own category/difficulty wins over the defaults.
+    Rows go in through executemany in chunks of ``chunk_size``; questions
+    already in the bank (same content hash) are skipped. Returns
+    {"imported", "skipped", "seconds", "rows_per_second"}.
+    """
+    started = time.perf_counter()
+    imported = 0
+    total = 0
+    
+    with db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        chunk = []
+        for q in questions:
+            total += 1
+            chunk.append((
+                q['question_type'], q['content'], q.get('options'), q['answer'], q.get('explanation'),
+                q.get('difficulty') or difficulty, q.get('category') or category,
+                question_content_hash(q['question_type'], q['content'], q.get('options'), q['answer'])
+            ))
+            if len(chunk) >= chunk_size:
+                imported += conn.executemany(INSERT_QUESTION_SQL, chunk).rowcount
+                chunk = []
+        if chunk:
+            imported += conn.executemany(INSERT_QUESTION_SQL, chunk).rowcount
+    _catalog.invalidate()
+    
+    seconds = time.perf_counter() - started
+    return {
+        "imported": imported,
+        "skipped": total - imported,
+        "seconds": seconds,
+        "rows_per_second": total / seconds if seconds > 0 else 0
+    }
+
 def import_questions_from_txt(file_path, category, difficulty=2):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    questions = parse_questions_file(file_path)
+    return bulk_import_questions(questions, category=category, difficulty=difficulty)
+
+def get_all_questions():
+    return list(_catalog.bucket())
+
+# Online backup
+# Uses the sqlite3 backup API against a dedicated connection, so the pool is
+# not held while pages are copied. A paced backup restarts whenever another
+# connection writes; after BACKUP_MAX_RESTARTS it falls back to one step,
+# which in WAL mode is a plain read transaction that writers don't wait on.
+class _BackupRestarted(Exception):
+    pass
+
+def _backup_prefix(db_path=None):
+    return os.path.splitext(os.path.basename(db_path or DB_PATH))[0] + '-'
+
+def list_backups(dest_dir=BACKUP_DIR, db_path=None):
+    """Backup files for the current database (or the given shard file), newest first."""
+    if not os.path.isdir(dest_dir):
+        return []
+    prefix = _backup_prefix(db_path)
+    names = [name for name in os.listdir(dest_dir)
+             if name.startswith(prefix) and name.endswith(('.db', '.db.gz'))]
+    return [os.path.join(dest_dir, name) for name in sorted(names, reverse=True)]
+
+def _rotate_backups(dest_dir, keep, db_path=None):
+    removed = []
+    for path in list_backups(dest_dir, db_path)[keep:]:
+        os.chmod(path, 0o644)
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+def _backup_file(db_path, dest_dir, stamp, compress, pages, sleep):
+    """Copy one database file with the online backup API; returns (path, restarts)."""
+    path = os.path.join(dest_dir, f"{_backup_prefix(db_path)}{stamp}.db")
+    tmp_path = path + '.part'
+    restarts = 0
+    last_remaining = None
     
-    questions = content.split('\n\n')
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # remaining jumps back up when a write elsewhere restarted the copy
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        last_remaining = remaining
+        # sqlite3 only sleeps between steps on SQLITE_BUSY; pace every step here
+        if remaining and sleep:
+            time.sleep(sleep)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    source = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        target = sqlite3.connect(tmp_path)
+        try:
+            try:
+                source.backup(target, pages=pages, progress=progress)
+            except _BackupRestarted:
+                source.backup(target)
+            # Snapshots are opened read-only, which WAL mode would not allow
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
     
-    for q in questions:
-        lines = q.strip().split('\n')
-        if len(lines) < 3:  # Skip incomplete questions
-            continue
-        
-        question_content = lines[0]
-        
-        # Determine question type and parse accordingly
-        if any(line.startswith(('A.', 'B.', 'C.', 'D.')) for line in lines):
-            # Multiple choice question
-            options = '\n'.join([line for line in lines if line.startswith(('A.', 'B.', 'C.', 'D.'))])
-            
-            # Find answer line (typically starts with "答案:" or similar)
-            answer_line = next((line for line in lines if "答案" in line), None)
-            if answer_line:
-                answer = answer_line.split(":")[-1].strip()
-            else:
-                continue  # Skip if no answer found
-                
-            # Find explanation if it exists
-            explanation_line = next((line for line in lines if "解析" in line), None)
-            explanation = explanation_line.split(":")[-1].strip() if explanation_line else None
-            
-            cursor.execute(
-                "INSERT INTO questions (question_type, content, options, answer, explanation, difficulty, category) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                ('multiple_choice', question_content, options, answer, explanation, difficulty, category)
-            )
-        else:
-            # True/False or short answer question
-            answer_line = next((line for line in lines if "答案" in line), None)
-            if answer_line:
-                answer = answer_line.split(":")[-1].strip()
-            else:
-                continue
-                
-            explanation_line = next((line for line in lines if "解析" in line), None)
-            explanation = explanation_line.split(":")[-1].strip() if explanation_line else None
-            
-            question_type = 'true_false' if answer.lower() in ['t', 'f', '对', '错', 'true', 'false'] else 'short_answer'
-            
-            cursor.execute(
-                "INSERT INTO questions (question_type, content, options, answer, explanation, difficulty, category) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (question_type, question_content, None, answer, explanation, difficulty, category)
-            )
+    if compress:
+        path += '.gz'
+        with open(tmp_path, 'rb') as src, gzip.open(path + '.part', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(tmp_path)
+        tmp_path = path + '.part'
+    os.replace(tmp_path, path)
+    os.chmod(path, 0o444)
+    return path, restarts
+
+def backup_database(dest_dir=BACKUP_DIR, compress=False, keep=BACKUP_KEEP,
+                    pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP):
+    """Take a consistent copy of the live database without a maintenance window.
+
+    The copy is switched to rollback-journal mode and made read-only, so it can
+    be opened with open_snapshot(); with compress=True it is gzipped instead.
+    When sharded, every shard file is copied after the catalog under the same
+    timestamp (each file is consistent on its own). Only the newest ``keep``
+    backups of each file are retained. Returns
+    {"path", "shards", "bytes", "seconds", "restarts", "removed"}.
+    """
+    flush_attempts()
+    started = time.perf_counter()
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime()) + f"{int(time.time() * 1000) % 1000:03d}"
+    sources = [DB_PATH] + [shard_path(index) for index in range(SHARD_COUNT)]
+    paths = []
+    restarts = 0
+    removed = []
+    for db_path in sources:
+        path, file_restarts = _backup_file(db_path, dest_dir, stamp, compress, pages, sleep)
+        paths.append(path)
+        restarts += file_restarts
+        if keep:
+            removed += _rotate_backups(dest_dir, keep, db_path)
     
-    conn.commit()
-    conn.close()
-    return True
+    return {
+        "path": paths[0],
+        "shards": paths[1:],
+        "bytes": sum(os.path.getsize(path) for path in paths),
+        "seconds": time.perf_counter() - started,
+        "restarts": restarts,
+        "removed": removed
+    }
 
-def get_all_questions():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM questions")
-    questions = cursor.fetchall()
-    conn.close()
-    return questions
+def open_snapshot(path=None, dest_dir=BACKUP_DIR):
+    """Open a backup (the newest one by default) as an immutable, read-only
+    database for reporting jobs; the primary file is never touched."""
+    if path is None:
+        snapshots = [p for p in list_backups(dest_dir) if p.endswith('.db')]
+        if not snapshots:
+            raise FileNotFoundError(f"{dest_dir} 中没有可用的未压缩备份")
+        path = snapshots[0]
+    if path.endswith('.gz'):
+        raise ValueError("压缩备份需要先解压才能查询")
+    uri = f"file:{os.path.abspath(path)}?mode=ro&immutable=1"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
 
 if __name__ == "__main__":
-    init_db() 
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="考试系统数据库维护工具")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("init", help="创建数据表并执行迁移（默认）")
+    rebuild_parser = subparsers.add_parser("rebuild-stats", help="从答题记录重建用户统计表")
+    rebuild_parser.add_argument("--user-id", type=int, help="只重建指定用户")
+    subparsers.add_parser("dedupe-questions", help="合并题库中的重复题目")
+    archive_parser = subparsers.add_parser("archive-attempts", help="将过期答题记录移入归档表")
+    archive_parser.add_argument("--horizon-days", type=int, default=ARCHIVE_HORIZON_DAYS, help="保留在热表中的天数")
+    archive_parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="每个事务移动的记录数")
+    backup_parser = subparsers.add_parser("backup", help="在线备份数据库（不停机）")
+    backup_parser.add_argument("--dest", default=BACKUP_DIR, help="备份目录")
+    backup_parser.add_argument("--compress", action="store_true", help="gzip 压缩备份文件")
+    backup_parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="保留最近的备份数量，0 表示不清理")
+    backup_parser.add_argument("--interval", type=int, help="每隔多少秒备份一次（不指定则只备份一次）")
+    split_parser = subparsers.add_parser("split-shards", help="将分片前的答题记录迁移到各分片（需设置 EXAM_DB_SHARDS）")
+    split_parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="每个事务迁移的记录数")
+    sweep_parser = subparsers.add_parser("sweep-orphans", help="清理已删除题目或用户遗留的答题记录")
+    sweep_parser.add_argument("--batch-size", type=int, default=DELETE_CHUNK_SIZE, help="每个事务删除的记录数")
+    args = parser.parse_args()
+    
+    init_db()
+    if args.command == "rebuild-stats":
+        rebuild_user_stats(args.user_id)
+        print("用户统计表重建完成")
+    elif args.command == "dedupe-questions":
+        print(f"已删除 {dedupe_questions()} 道重复题目")
+    elif args.command == "archive-attempts":
+        print(f"已归档 {archive_attempts(args.horizon_days, args.batch_size)} 条答题记录")
+    elif args.command == "split-shards":
+        if not SHARD_COUNT:
+            print("未启用分片：请先设置 EXAM_DB_SHARDS")
+        else:
+            print(f"已将 {split_into_shards(args.batch_size)} 条答题记录迁移到 {SHARD_COUNT} 个分片")
+    elif args.command == "sweep-orphans":
+        print(f"已清理 {sweep_orphans(args.batch_size)} 条孤立答题记录")
+    elif args.command == "backup":
+        while True:
+            report = backup_database(args.dest, compress=args.compress, keep=args.keep)
+            print(f"已备份到 {report['path']}{'（含 %d 个分片）' % len(report['shards']) if report['shards'] else ''}（{report['bytes']} 字节，耗时 {report['seconds']:.1f} 秒，"
+                  f"清理旧备份 {len(report['removed'])} 个）")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
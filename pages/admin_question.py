@@ -1,7 +1,7 @@
 import streamlit as st
 import database as db
 import auth
-from utils.ui import header, subheader, card, pagination_nav
+from utils.ui import header, subheader, card, pagination_nav, keyset_pagination_nav
 import pandas as pd
 import os
 from utils.question_parser import parse_questions_file
@@ -33,10 +33,8 @@ def show_question_list():
     """Display and manage the question list"""
     st.subheader("题目列表")
     
-    # Get all questions
-    questions = db.get_all_questions()
-    
-    if not questions:
+    # Only the total is needed up front; rows are loaded one page at a time
+    if db.count_questions() == 0:
         st.info("题库中暂无题目")
         return
     
@@ -64,38 +62,71 @@ def show_question_list():
             ["全部", "单选题", "判断题", "简答题"]
         )
     
-    # Apply filters
-    filtered_questions = questions
+    type_map = {
+        "单选题": "multiple_choice",
+        "判断题": "true_false",
+        "简答题": "short_answer"
+    }
+    category_filter = None if selected_category == "全部" else selected_category
+    difficulty_filter = None if selected_difficulty == "全部" else int(selected_difficulty)
+    type_filter = type_map.get(selected_type)
     
-    if selected_category != "全部":
-        filtered_questions = [q for q in filtered_questions if q['category'] == selected_category]
+    col1, col2 = st.columns([3, 1])
     
-    if selected_difficulty != "全部":
-        difficulty = int(selected_difficulty)
-        filtered_questions = [q for q in filtered_questions if q['difficulty'] == difficulty]
+    with col1:
+        # Search box
+        search_query = st.text_input("搜索题目", placeholder="输入关键词搜索题目内容、选项或解析")
     
-    if selected_type != "全部":
-        type_map = {
-            "单选题": "multiple_choice",
-            "判断题": "true_false",
-            "简答题": "short_answer"
+    with col2:
+        sort_options = {
+            "最新添加": ("id", True),
+            "最早添加": ("id", False),
+            "难度升序": ("difficulty", False),
+            "难度降序": ("difficulty", True),
+            "按类别": ("category", False)
         }
-        question_type = type_map.get(selected_type)
-        if question_type:
-            filtered_questions = [q for q in filtered_questions if q['question_type'] == question_type]
+        selected_sort = st.selectbox("排序方式", list(sort_options.keys()))
+        sort_key, descending = sort_options[selected_sort]
     
-    # Search box
-    search_query = st.text_input("搜索题目", placeholder="输入关键词搜索题目内容")
-    if search_query:
-        filtered_questions = [q for q in filtered_questions if search_query.lower() in q['content'].lower()]
-    
-    # Display questions
-    st.write(f"共找到 {len(filtered_questions)} 个题目")
-    
-    # Pagination
     items_per_page = 10
-    page = pagination_nav(len(filtered_questions), items_per_page, "admin_q_page")
-    page_questions = filtered_questions[page * items_per_page:(page + 1) * items_per_page]
+    highlights = {}
+    
+    if search_query:
+        # Ranked full-text search; only the current page is loaded
+        total = db.count_search_results(
+            search_query, category=category_filter, difficulty=difficulty_filter, question_type=type_filter
+        )
+        st.write(f"共找到 {total} 个题目")
+        page = pagination_nav(total, items_per_page, "admin_q_page")
+        results = db.search_questions(
+            search_query,
+            limit=items_per_page,
+            offset=page * items_per_page,
+            category=category_filter,
+            difficulty=difficulty_filter,
+            question_type=type_filter
+        )
+        highlights = {r['id']: r['highlight'] for r in results}
+        page_questions = db.get_questions_by_ids([r['id'] for r in results])
+    else:
+        # Filtering and keyset pagination happen in SQL
+        filters = dict(category=category_filter, difficulty=difficulty_filter, question_type=type_filter)
+        total = db.count_questions(**filters)
+        st.write(f"共找到 {total} 个题目")
+        
+        state = keyset_pagination_nav(
+            total, items_per_page, "admin_q_cursor",
+            filter_key=(category_filter, difficulty_filter, type_filter, sort_key, descending)
+        )
+        result = db.list_questions(
+            sort=sort_key,
+            descending=descending,
+            cursor=state['cursors'][-1],
+            page_size=items_per_page,
+            **filters
+        )
+        state['next_cursor'] = result['next_cursor']
+        page_questions = result['rows']
     
     # Create a table for display
     question_table = []
@@ -117,6 +148,12 @@ def show_question_list():
     question_df = pd.DataFrame(question_table)
     st.dataframe(question_df, use_container_width=True)
     
+    # Show where the search terms matched
+    if highlights:
+        with st.expander("搜索匹配", expanded=True):
+            for q in page_questions:
+                st.markdown(f"**#{q['id']}** {highlights.get(q['id'], '')}", unsafe_allow_html=True)
+    
     # Edit question modal
     if 'edit_question_id' not in st.session_state:
         st.session_state.edit_question_id = None
@@ -302,7 +339,7 @@ def show_add_question_form():
                     # Clear form (need to rerun)
                     st.experimental_rerun()
                 else:
-                    st.error("添加失败，请稍后重试")
+                    st.error("添加失败，题库中可能已存在相同的题目")
 
 def show_import_questions():
     """Display interface to import questions from files"""
@@ -396,19 +433,13 @@ def show_import_questions():
                         
                         f.write("\n")  # Empty line between questions
                 
-                # Import to database
-                for q in questions:
-                    db.add_question(
-                        question_type=q['question_type'],
-                        content=q['content'],
-                        options=q['options'],
-                        answer=q['answer'],
-                        explanation=q['explanation'],
-                        difficulty=difficulty,
-                        category=category
-                    )
+                # Import to database in one transaction
+                report = db.bulk_import_questions(questions, category=category, difficulty=difficulty)
                 
-                st.success(f"成功导入 {len(questions)} 个题目到类别 '{category}'")
+                st.success(
+                    f"成功导入 {report['imported']} 个题目到类别 '{category}'，跳过 {report['skipped']} 个重复题目"
+                    f"（耗时 {report['seconds']:.2f} 秒，{report['rows_per_second']:.0f} 题/秒）"
+                )
     
     # Instructions for file format
     st.markdown("---")
@@ -442,20 +473,26 @@ def show_category_management():
     """Display interface to manage categories"""
     st.subheader("类别管理")
     
-    # Get all categories
-    categories = db.get_all_categories()
+    # Counts come from the category catalog, one row per category
+    category_stats = db.get_category_stats()
+    categories = [row['name'] for row in category_stats]
     
     if not categories:
         st.info("暂无题目类别")
     else:
         # Display categories and question counts
         category_data = []
-        for category in categories:
-            questions = db.get_questions_by_category(category)
+        for row in category_stats:
             category_data.append({
-                "类别": category,
-                "题目数量": len(questions),
-                "平均难度": sum(q['difficulty'] for q in questions) / len(questions) if questions else 0
+                "类别": row['name'],
+                "题目数量": row['question_count'],
+                "平均难度": round(row['avg_difficulty'], 2),
+                "★": row['easy_count'],
+                "★★": row['medium_count'],
+                "★★★": row['hard_count'],
+                "单选题": row['multiple_choice_count'],
+                "判断题": row['true_false_count'],
+                "简答题": row['short_answer_count']
             })
         
         category_df = pd.DataFrame(category_data)
@@ -469,9 +506,10 @@ def show_category_management():
         if submitted and new_category:
             # Create a new empty file for the category
             file_path = f"data/questions/{new_category}.txt"
-            if not os.path.exists(file_path):
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write("# 在此添加题目，每题之间用空行分隔\n\n")
+            if db.add_category(new_category):
+                if not os.path.exists(file_path):
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        f.write("# 在此添加题目，每题之间用空行分隔\n\n")
                 st.success(f"类别 '{new_category}' 添加成功！")
                 st.experimental_rerun()
             else:
@@ -492,15 +530,30 @@ def show_category_management():
                 if not confirmed:
                     st.error("请先确认删除操作")
                 else:
-                    # Delete questions from database
-                    questions = db.get_questions_by_category(category_to_delete)
-                    for q in questions:
-                        db.delete_question(q['id'])
+                    # Questions, attempts and statistics go in one transaction
+                    deleted = db.delete_category(category_to_delete)
                     
                     # Delete category file
                     file_path = f"data/questions/{category_to_delete}.txt"
                     if os.path.exists(file_path):
                         os.remove(file_path)
                     
-                    st.success(f"类别 '{category_to_delete}' 及其题目已删除")
-                    st.experimental_rerun() 
\ No newline at end of file
+                    st.success(f"类别 '{category_to_delete}' 及其 {deleted} 道题目已删除")
+                    st.experimental_rerun()
+    
+    # Attempts left behind by questions deleted before cleanup was cascaded
+    st.markdown("---")
+    st.subheader("清理孤立答题记录")
+    sweep_status = db.get_orphan_sweep_status()
+    if sweep_status["running"]:
+        st.info(f"正在后台清理，已删除 {sweep_status['deleted']} 条记录")
+    elif sweep_status["finished_at"]:
+        st.success(
+            f"上次清理于 {sweep_status['finished_at']} 完成，删除 {sweep_status['deleted']} 条记录，"
+            f"重建 {sweep_status['users']} 个用户的统计"
+        )
+    if st.button("开始清理", disabled=sweep_status["running"]):
+        if db.start_orphan_sweeper():
+            st.info("已在后台开始清理")
+        else:
+            st.warning("清理任务正在运行") 
\ No newline at end of file
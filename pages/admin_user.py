@@ -1,15 +1,16 @@
 import streamlit as st
 import database as db
 import auth
-from utils.ui import header, subheader, card
+from utils.ui import header, subheader, card, pagination_nav, user_data_export
 import pandas as pd
+from utils import export, query_stats
 
 @auth.admin_required
 def admin_user_page():
     header("用户管理", "查看、添加和管理用户")
     
     # Create tabs for different operations
-    tab1, tab2 = st.tabs(["用户列表", "添加用户"])
+    tab1, tab2, tab3, tab4 = st.tabs(["用户列表", "添加用户", "数据导出", "查询性能"])
     
     with tab1:
         # Display all users
@@ -18,28 +19,50 @@ def admin_user_page():
     with tab2:
         # Form to add a new user
         show_add_user_form()
+    
+    with tab3:
+        # Analytics export of all attempts
+        show_analytics_export()
+    
+    with tab4:
+        # SQL latency per function and page, plus the slow-query log
+        show_query_stats()
 
 def show_user_list():
     """Display and manage user list"""
     st.subheader("用户列表")
     
-    # Get all users
-    users = db.get_all_users()
+    total_users = db.count_users()
     
-    if not users:
+    if total_users == 0:
         st.info("暂无用户")
         return
     
+    sort_options = {
+        "注册顺序": ("id", False),
+        "最新注册": ("id", True),
+        "答题数最多": ("total_attempts", True),
+        "正确率最高": ("accuracy", True),
+        "正确率最低": ("accuracy", False),
+        "用户名": ("username", False)
+    }
+    selected_sort = st.selectbox("排序方式", list(sort_options.keys()))
+    sort_key, descending = sort_options[selected_sort]
+    
+    # One grouped query per page instead of loading every user's history
+    items_per_page = 50
+    page = pagination_nav(total_users, items_per_page, "admin_user_page")
+    users = db.get_users_with_stats(
+        sort=sort_key,
+        descending=descending,
+        limit=items_per_page,
+        offset=page * items_per_page
+    )
+    
     # Convert to dataframe for display
     user_data = []
     for user in users:
-        # Get user progress data
-        progress = db.get_user_progress(user['id'])
-        
-        # Calculate statistics
-        total_attempts = len(progress)
-        correct_count = sum(1 for p in progress if p['is_correct'])
-        accuracy = correct_count / total_attempts * 100 if total_attempts > 0 else 0
+        total_attempts = user['total_attempts']
         
         user_data.append({
             "ID": user['id'],
@@ -48,7 +71,7 @@ def show_user_list():
             "角色": "管理员" if user['is_admin'] else "普通用户",
             "注册时间": user['created_at'],
             "总答题数": total_attempts,
-            "正确率": f"{accuracy:.1f}%" if total_attempts > 0 else "-"
+            "正确率": f"{user['accuracy']:.1f}%" if total_attempts > 0 else "-"
         })
     
     user_df = pd.DataFrame(user_data)
@@ -89,6 +112,7 @@ def show_user_list():
                 # Confirm deletion
                 if st.checkbox("确认删除此用户？此操作不可恢复！"):
                     if db.delete_user(selected_user_id):
+                        auth.drop_user_sessions(selected_user_id)
                         st.success("用户删除成功")
                         st.experimental_rerun()
                     else:
@@ -175,6 +199,70 @@ def show_add_user_form():
                 else:
                     st.error("添加失败，用户名可能已存在")
 
+def show_analytics_export():
+    """Incremental Parquet export of attempt history for the data team"""
+    st.subheader("答题记录导出 (Parquet)")
+    st.markdown("按月份和类别分区导出全部答题记录及题目信息，每次只导出上次之后的新记录。")
+    
+    if not export.parquet_available():
+        st.error("导出 Parquet 需要安装 pyarrow")
+        return
+    
+    out_dir = st.text_input("导出目录", value=export.PARQUET_EXPORT_DIR)
+    state = export.load_export_state(out_dir)
+    if state["exported_at"]:
+        st.info(f"上次导出于 {state['exported_at']}，累计 {state['rows']} 条记录，最新记录 ID {max(state['last_ids'], default=0)}")
+    else:
+        st.info("尚未导出过")
+    
+    full = st.checkbox("忽略上次进度，全部重新导出")
+    if st.button("开始导出"):
+        with st.spinner("正在导出..."):
+            report = export.export_attempts_parquet(out_dir, full=full)
+        st.success(
+            f"已导出 {report['rows']} 条记录到 {report['files']} 个文件，耗时 {report['seconds']:.1f} 秒"
+        )
+
+def show_query_stats():
+    """SQL statement timings collected by utils.query_stats since the server started"""
+    st.subheader("查询性能")
+    if not query_stats.TRACE_ENABLED:
+        st.info("SQL 统计未开启（设置环境变量 EXAM_SQL_TRACE=1 后启用）")
+        return
+    st.markdown(f"耗时超过 {query_stats.SLOW_QUERY_MS:g} ms 的语句会连同执行计划记入慢查询日志。")
+    
+    def stats_frame(stats, label):
+        return pd.DataFrame([
+            {label: name, "调用次数": s["calls"], "返回行数": s["rows"], "总耗时(ms)": round(s["total_ms"], 1),
+             "P50(ms)": round(s["p50_ms"], 2), "P95(ms)": round(s["p95_ms"], 2),
+             "P99(ms)": round(s["p99_ms"], 2), "最大(ms)": round(s["max_ms"], 2)}
+            for name, s in stats.items()
+        ])
+    
+    function_stats = query_stats.get_function_stats()
+    if not function_stats:
+        st.info("暂无统计数据")
+        return
+    st.markdown("#### 按函数")
+    st.dataframe(stats_frame(function_stats, "函数"), use_container_width=True)
+    st.markdown("#### 按页面")
+    st.dataframe(stats_frame(query_stats.get_page_stats(), "页面"), use_container_width=True)
+    
+    st.markdown("#### 慢查询")
+    slow_queries = query_stats.get_slow_queries()
+    if not slow_queries:
+        st.info("暂无慢查询")
+    for entry in slow_queries[:20]:
+        with st.expander(f"{entry['ms']:.1f} ms · {entry['function']} · {entry['page'] or '-'} · {entry['time']}"):
+            st.code(entry['sql'], language="sql")
+            if entry['plan']:
+                st.code("\n".join(entry['plan']))
+            st.caption(f"返回/影响行数: {entry['rows']}")
+    
+    if st.button("清空统计"):
+        query_stats.reset()
+        st.experimental_rerun()
+
 def show_user_data(user_id):
     """Display detailed user data"""
     st.markdown("---")
@@ -239,10 +327,10 @@ def show_user_data(user_id):
     # Recent activity
     st.subheader("最近活动")
     
-    progress = db.get_user_progress(user_id)
+    progress = db.get_user_progress(user_id, include_archive=True, limit=10)
     if progress:
         recent_data = []
-        for p in progress[:10]:  # Get 10 most recent activities
+        for p in progress:  # Get 10 most recent activities
             recent_data.append({
                 "时间": p['attempt_time'],
                 "题目": p['content'][:50] + "..." if len(p['content']) > 50 else p['content'],
@@ -257,28 +345,5 @@ def show_user_data(user_id):
         st.info("无活动记录")
     
     # Export user data
-    if st.button("导出用户数据"):
-        # Prepare data for export
-        export_data = []
-        for p in progress:
-            export_data.append({
-                "题目ID": p['id'],
-                "题目内容": p['content'],
-                "类别": p['category'],
-                "难度": p['difficulty'],
-                "提交答案": p['user_answer'],
-                "是否正确": "是" if p['is_correct'] else "否",
-                "提交时间": p['attempt_time']
-            })
-        
-        export_df = pd.DataFrame(export_data)
-        
-        # Convert to CSV for download
-        csv = export_df.to_csv(index=False)
-        
-        st.download_button(
-            label="下载CSV文件",
-            data=csv,
-            file_name=f"user_data_{user['username']}.csv",
-            mime="text/csv"
-        ) 
\ No newline at end of file
+    user_data_export(user_id, f"user_data_{user['username']}", f"admin_user_export_{user_id}",
+                     button_label="导出用户数据") 
\ No newline at end of file
@@ -5,7 +5,7 @@ from utils.ui import header, subheader, card
 import pandas as pd
 import plotly.express as px
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import plotly.graph_objects as go
 
 # Helper functions for dashboard
@@ -28,6 +28,39 @@ def create_gauge_chart(value, title, height=300):
     fig.update_layout(height=height)
     return fig
 
+def create_activity_heatmap(calendar_rows, days=365, height=260):
+    """GitHub-style calendar: one column per week, one row per weekday."""
+    counts = {row["date"]: row["attempts"] for row in calendar_rows}
+    
+    # Activity days are UTC days, matching how attempts are stored
+    end = datetime.now(timezone.utc).date()
+    start = end - timedelta(days=days - 1)
+    start -= timedelta(days=start.weekday())  # align the first column to Monday
+    num_weeks = (end - start).days // 7 + 1
+    
+    z = [[None] * num_weeks for _ in range(7)]
+    text = [[""] * num_weeks for _ in range(7)]
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        week, weekday = divmod(offset, 7)
+        attempts = counts.get(day.isoformat(), 0)
+        z[weekday][week] = attempts
+        text[weekday][week] = f"{day.isoformat()}: {attempts} 题"
+    
+    fig = go.Figure(go.Heatmap(
+        z=z,
+        x=[(start + timedelta(weeks=w)).strftime("%Y-%m-%d") for w in range(num_weeks)],
+        y=["周一", "周二", "周三", "周四", "周五", "周六", "周日"],
+        text=text,
+        hoverinfo="text",
+        colorscale="Greens",
+        xgap=2,
+        ygap=2,
+        showscale=False
+    ))
+    fig.update_layout(height=height, yaxis=dict(autorange="reversed"), margin=dict(t=30, b=30))
+    return fig
+
 def get_user_stats(user_id):
     # Get user stats directly from database
     stats = db.get_user_stats(user_id)
@@ -40,42 +73,19 @@ def get_user_stats(user_id):
             "accuracy": 0,
             "category_stats": [],
             "daily_progress": [],
+            "answered_questions": 0,
             "streak": 0
         }
     
-    # Calculate streak
-    progress = db.get_user_progress(user_id)
-    today = datetime.now().date()
-    
-    dates = []
-    if progress:
-        dates = sorted([datetime.strptime(attempt["attempt_time"], "%Y-%m-%d %H:%M:%S").date() 
-                       for attempt in progress], reverse=True)
-    
-    streak = 0
-    if dates:
-        current_date = today
-        for date in dates:
-            if date == current_date:
-                streak += 1
-                current_date = current_date - timedelta(days=1)
-            elif date < current_date:
-                # Skip ahead to this date
-                current_date = date
-                streak += 1
-                current_date = current_date - timedelta(days=1)
-            else:
-                # Future date, should not happen
-                pass
-    
-    # Return modified stats
+    # Return modified stats; the streak is maintained by the database on insert
     return {
         "total_attempts": stats["total_attempts"],
         "correct_attempts": stats["correct_answers"],
         "accuracy": stats["accuracy"],
         "category_stats": stats["category_stats"] if "category_stats" in stats else [],
         "daily_progress": stats["daily_progress"] if "daily_progress" in stats else [],
-        "streak": streak
+        "answered_questions": stats.get("answered_questions", 0),
+        "streak": stats.get("streak", 0)
     }
 
 @auth.login_required
@@ -92,6 +102,9 @@ def dashboard_page():
         st.info("你还没有做过题目，请先在刷题中心开始练习！")
         return
     
+    # 用户已回答的独立题目数量（写入答题记录时维护在汇总表中）
+    unique_answered = stats["answered_questions"]
+    
     # Overview cards
     col1, col2, col3, col4 = st.columns(4)
     
@@ -108,18 +121,8 @@ def dashboard_page():
         card_container.markdown(f"<p class='big-number'>{stats['streak']} 天</p>", unsafe_allow_html=True)
     
     with col4:
-        # 安全地获取用户已回答的独立题目数量
-        progress = db.get_user_progress(user_id)
-        unique_count = 0
-        if progress:
-            unique_questions = set()
-            for attempt in progress:
-                if "question_id" in attempt:
-                    unique_questions.add(attempt["question_id"])
-            unique_count = len(unique_questions)
-        
         card_container = card(title="已练习题目")
-        card_container.markdown(f"<p class='big-number'>{unique_count}</p>", unsafe_allow_html=True)
+        card_container.markdown(f"<p class='big-number'>{unique_answered}</p>", unsafe_allow_html=True)
     
     # Accuracy trend
     st.markdown("---")
@@ -149,6 +152,15 @@ def dashboard_page():
     else:
         st.info("暂无近期学习数据，开始做题后可查看趋势。")
     
+    # Year-long activity calendar from the daily rollup
+    st.markdown("---")
+    st.subheader("年度学习日历")
+    
+    calendar_rows = db.get_user_activity_calendar(user_id, days=365)
+    active_days = sum(1 for row in calendar_rows if row["attempts"] > 0)
+    st.write(f"过去一年共学习 {active_days} 天")
+    st.plotly_chart(create_activity_heatmap(calendar_rows), use_container_width=True)
+    
     # Category performance
     if stats["category_stats"]:
         st.markdown("---")
@@ -171,18 +183,8 @@ def dashboard_page():
     st.markdown("---")
     st.subheader("总体学习进度")
     
-    # Get total questions count
-    total_questions = len(db.get_all_questions())
-    
-    # 安全地获取用户已回答的独立题目数量
-    user_progress = db.get_user_progress(user_id)
-    unique_answered = 0
-    if user_progress:
-        unique_questions = set()
-        for attempt in user_progress:
-            if "question_id" in attempt:
-                unique_questions.add(attempt["question_id"])
-        unique_answered = len(unique_questions)
+    # Get total questions count (cached until the question bank changes)
+    total_questions = db.count_questions()
     
     col1, col2 = st.columns(2)
     
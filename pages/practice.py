@@ -17,8 +17,8 @@ def practice_page():
     user = auth.get_current_user()
     user_id = user['id']
     
-    # Get all categories
-    categories = db.get_all_categories()
+    # Only categories that have questions can be practiced
+    categories = db.get_all_categories(include_empty=False)
     if not categories:
         st.info("题库中暂无题目，请联系管理员添加题目")
         return
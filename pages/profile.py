@@ -1,7 +1,7 @@
 import streamlit as st
 import database as db
 import auth
-from utils.ui import header, subheader, card
+from utils.ui import header, subheader, card, user_data_export
 import pandas as pd
 
 @auth.login_required
@@ -59,17 +59,17 @@ def profile_page():
     st.markdown("---")
     st.subheader("学习活动概览")
     
-    # Get user progress
-    progress = db.get_user_progress(user_id)
+    # Totals come from the materialized statistics, which cover archived attempts too
+    stats = db.get_user_stats(user_id)
     
-    if not progress:
+    if not stats['total_attempts']:
         st.info("你还没有任何学习记录，请先在刷题中心开始练习！")
         return
     
     # Calculate overall statistics
-    total_attempts = len(progress)
-    correct_count = sum(1 for p in progress if p['is_correct'])
-    accuracy = correct_count / total_attempts * 100 if total_attempts > 0 else 0
+    total_attempts = stats['total_attempts']
+    correct_count = stats['correct_answers']
+    accuracy = stats['accuracy']
     
     col1, col2, col3 = st.columns(3)
     
@@ -86,7 +86,7 @@ def profile_page():
     st.subheader("最近活动")
     
     recent_activity = []
-    for p in progress[:10]:  # Get 10 most recent activities
+    for p in db.get_user_progress(user_id, include_archive=True, limit=10):  # Get 10 most recent activities
         recent_activity.append({
             "时间": p['attempt_time'],
             "题目": p['content'][:50] + "..." if len(p['content']) > 50 else p['content'],
@@ -102,31 +102,8 @@ def profile_page():
         st.warning("注意: 以下操作不可逆，请谨慎操作！")
         
         # Export data
-        if st.button("导出我的学习数据"):
-            # Prepare data for export
-            export_data = []
-            for p in progress:
-                export_data.append({
-                    "题目ID": p['id'],
-                    "题目内容": p['content'],
-                    "类别": p['category'],
-                    "难度": p['difficulty'],
-                    "提交答案": p['user_answer'],
-                    "是否正确": "是" if p['is_correct'] else "否",
-                    "提交时间": p['attempt_time']
-                })
-            
-            export_df = pd.DataFrame(export_data)
-            
-            # Convert to CSV for download
-            csv = export_df.to_csv(index=False)
-            
-            st.download_button(
-                label="下载CSV文件",
-                data=csv,
-                file_name=f"learning_data_{user_info['username']}.csv",
-                mime="text/csv"
-            )
+        user_data_export(user_id, f"learning_data_{user_info['username']}", "profile_export",
+                         button_label="导出我的学习数据")
         
         # Delete account (would require additional confirmation in a real app)
         if st.button("删除我的账号", type="primary"):
@@ -27,23 +27,15 @@ def wrong_questions_page():
         show_question_review(st.session_state.review_question, user_id)
         return
     
-    # Get wrong questions
-    wrong_questions = db.get_user_wrong_questions(user_id)
+    # Summary counts come straight from the mistake ledger
+    category_counts = db.get_user_wrong_category_counts(user_id)
+    total_wrong = sum(row['count'] for row in category_counts)
     
-    if not wrong_questions:
+    if total_wrong == 0:
         st.info("你还没有做错的题目，继续加油！")
         return
     
-    # Display statistics
-    total_wrong = len(wrong_questions)
-    
-    # Group by category
-    categories = {}
-    for q in wrong_questions:
-        cat = q['category']
-        if cat not in categories:
-            categories[cat] = 0
-        categories[cat] += 1
+    categories = {row['category']: row['count'] for row in category_counts}
     
     col1, col2 = st.columns(2)
     
@@ -69,23 +61,27 @@ def wrong_questions_page():
             "排序方式",
             ["最近错误", "难度升序", "难度降序"]
         )
+        
+        only_unresolved = st.checkbox("只看尚未答对的题目")
     
-    # Apply filters
-    filtered_questions = wrong_questions
-    if selected_category != "全部":
-        filtered_questions = [q for q in wrong_questions if q['category'] == selected_category]
-    
-    # Apply sorting
-    if sort_by == "难度升序":
-        filtered_questions = sorted(filtered_questions, key=lambda q: q['difficulty'])
-    elif sort_by == "难度降序":
-        filtered_questions = sorted(filtered_questions, key=lambda q: q['difficulty'], reverse=True)
-    # For "最近错误", no need to sort as it's already sorted by attempt_time DESC in the database query
+    # Filtering, sorting and pagination all happen in SQL
+    sort_key = {"最近错误": "recent", "难度升序": "difficulty_asc", "难度降序": "difficulty_desc"}[sort_by]
+    category_filter = None if selected_category == "全部" else selected_category
+    filtered_count = db.count_user_wrong_questions(
+        user_id, category=category_filter, include_resolved=not only_unresolved
+    )
     
     # Pagination
     items_per_page = 5
-    page = pagination_nav(len(filtered_questions), items_per_page, "wrong_q_page")
-    page_questions = filtered_questions[page * items_per_page:(page + 1) * items_per_page]
+    page = pagination_nav(filtered_count, items_per_page, "wrong_q_page")
+    page_questions = db.get_user_wrong_questions(
+        user_id,
+        category=category_filter,
+        sort=sort_key,
+        limit=items_per_page,
+        offset=page * items_per_page,
+        include_resolved=not only_unresolved
+    )
     
     # Display questions
     for i, question in enumerate(page_questions):
@@ -111,6 +107,7 @@ def wrong_questions_page():
             st.markdown(f"**难度:** {'★' * question['difficulty']}")
             st.markdown(f"**类别:** {question['category']}")
             st.markdown(f"**回答时间:** {question['attempt_time']}")
+            st.markdown(f"**错误次数:** {question['wrong_count']}{'（已答对）' if question['resolved'] else ''}")
             
             # Practice again button - 移到单独的列中，确保不在表单内
             col1, col2, col3 = st.columns([1, 3, 1])
@@ -0,0 +1,266 @@
+import os
+import sys
+import shutil
+import sqlite3
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+# The database shipped with the repo predates every migration
+BASELINE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'exam_system.db')
+AGGREGATE_TABLES = ('user_stats_summary', 'user_category_stats', 'user_difficulty_stats',
+                    'user_daily_activity', 'user_mistakes')
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    shards = db.SHARD_COUNT
+    db.configure_database(str(tmp_path / 'exam.db'), shards=0)
+    db.init_db()
+    yield
+    db.flush_attempts()
+    db.configure_database(shards=shards)
+    db.close_database()
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    shards = db.SHARD_COUNT
+    path = tmp_path / 'baseline.db'
+    shutil.copy(BASELINE_DB, path)
+    db.configure_database(str(path), shards=0)
+    yield path
+    db.flush_attempts()
+    db.configure_database(shards=shards)
+    db.close_database()
+
+def _aggregates():
+    """Contents of every statistics table, over all shards."""
+    db.flush_attempts()
+    snapshot = {table: [] for table in AGGREGATE_TABLES}
+    for index in range(db.shard_count()):
+        with db.shard_connection(index) as conn:
+            for table in AGGREGATE_TABLES:
+                snapshot[table] += [tuple(row) for row in conn.execute(f"SELECT * FROM {table}")]
+    return {table: sorted(rows) for table, rows in snapshot.items()}
+
+def _assert_aggregates_match_rebuild():
+    maintained = _aggregates()
+    db.rebuild_user_stats()
+    assert maintained == _aggregates()
+
+def _make_questions(count, category='测试'):
+    for number in range(count):
+        db.add_question('true_false', f"测试题目 {number}", "对", 1 + number % 3, category)
+    return [question['id'] for question in db.get_all_questions()]
+
+def _store(user_id, question_id, is_correct, when, answer="对"):
+    # Write attempts with a chosen timestamp, as the writer would
+    with db.user_connection(user_id) as conn:
+        db._store_attempts(conn, [(user_id, question_id, is_correct, answer) + db.attempt_stamp(when)])
+
+def test_migrations_upgrade_baseline_database(baseline_db):
+    with sqlite3.connect(baseline_db) as conn:
+        attempts = conn.execute("SELECT COUNT(*) FROM user_progress").fetchone()[0]
+    db.init_db()
+
+    assert db.get_schema_version() == max(version for version, _, _ in db.MIGRATIONS)
+    with db.db_connection() as conn:
+        row = conn.execute("""
+            SELECT COUNT(*), SUM(attempt_ts IS NULL), SUM(attempt_day != attempt_ts / 86400)
+            FROM user_progress
+        """).fetchone()
+        assert tuple(row) == (attempts, 0, 0)
+        assert conn.execute("SELECT COUNT(*) FROM user_progress_all").fetchone()[0] == attempts
+        # Daily rollups are keyed on day numbers
+        assert {row[0] for row in conn.execute("SELECT typeof(day) FROM user_daily_activity")} == {'integer'}
+        for user_id, answered in conn.execute("SELECT user_id, answered_questions FROM user_stats_summary"):
+            assert answered == conn.execute(
+                "SELECT COUNT(DISTINCT question_id) FROM user_progress WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+    _assert_aggregates_match_rebuild()
+
+    # Running the migrations again is a no-op
+    db.init_db()
+    _assert_aggregates_match_rebuild()
+
+def test_split_into_shards_routes_attempts_by_user(baseline_db):
+    db.init_db()
+    with db.db_connection() as conn:
+        per_user = dict(conn.execute("SELECT user_id, COUNT(*) FROM user_progress GROUP BY user_id").fetchall())
+    before = _aggregates()
+
+    db.configure_database(shards=2)
+    db.init_db()
+    assert db.split_into_shards() == sum(per_user.values())
+
+    with db.db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM user_progress").fetchone()[0] == 0
+    for index in range(2):
+        with db.shard_connection(index) as conn:
+            for user_id, count in conn.execute("SELECT user_id, COUNT(*) FROM user_progress GROUP BY user_id"):
+                assert db.shard_for_user(user_id) == index
+                assert count == per_user[user_id]
+    assert _aggregates() == before
+
+    # New attempts land in the user's shard with ids that do not collide
+    question_id = db.get_all_questions()[0]['id']
+    for user_id in per_user:
+        assert db.record_attempt(user_id, question_id, True, "对", wait=True)
+    ids = []
+    for index in range(2):
+        with db.shard_connection(index) as conn:
+            ids += [row[0] for row in conn.execute("SELECT id FROM user_progress")]
+    assert len(ids) == len(set(ids)) == sum(per_user.values()) + len(per_user)
+    _assert_aggregates_match_rebuild()
+
+def test_attempt_writer_group_commits(fresh_db, monkeypatch):
+    question_id = _make_questions(1)[0]
+    batches = []
+    store = db._store_attempts
+    monkeypatch.setattr(db, '_store_attempts', lambda conn, attempts: (batches.append(len(attempts)),
+                                                                        store(conn, attempts)))
+
+    writer = db.AttemptWriter(batch_size=50, flush_interval=0.5)
+    seqs = [writer.submit(1, question_id, number % 2, "对") for number in range(120)]
+    assert writer.flush(timeout=10)
+    writer.close()
+
+    assert sum(batches) == 120
+    assert len(batches) < 10
+    assert all(writer.wait_for(seq, timeout=0) for seq in seqs)
+    with db.db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM user_progress").fetchone()[0] == 120
+    assert db.get_user_stats(1)['total_attempts'] == 120
+
+def test_attempt_writer_marks_failed_rows(fresh_db):
+    question_id = _make_questions(1)[0]
+    writer = db.AttemptWriter(flush_interval=0.2)
+    good = writer.submit(1, question_id, True, "对")
+    # NOT NULL question_id: only this row fails when the batch is retried row by row
+    bad = writer.submit(1, None, True, "对")
+    last = writer.submit(1, question_id, False, "错")
+    assert writer.wait_for(last, timeout=10)
+    assert writer.wait_for(good, timeout=0)
+    assert not writer.wait_for(bad, timeout=0)
+    writer.close()
+    assert db.get_user_stats(1)['total_attempts'] == 2
+
+def test_attempt_writer_fails_locked_batch_at_once(fresh_db, monkeypatch):
+    question_id = _make_questions(1)[0]
+    calls = []
+
+    def locked(conn, attempts):
+        calls.append(len(attempts))
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(db, '_store_attempts', locked)
+    writer = db.AttemptWriter(flush_interval=0.2)
+    seqs = [writer.submit(1, question_id, True, "对") for _ in range(5)]
+    assert not writer.wait_for(seqs[-1], timeout=10)
+    writer.close()
+    assert not any(writer.wait_for(seq, timeout=0) for seq in seqs)
+    # No row-by-row retry against a locked database
+    assert calls == [5]
+
+def test_streaks_and_rollups_match_rebuild(fresh_db):
+    questions = _make_questions(6)
+    now = db._utc_day_number() * 86400 + 3600
+    # User 1: three days in a row ending today; user 2: a two-day run long ago
+    for days_ago in (2, 1, 0):
+        for question_id in questions[:3]:
+            _store(1, question_id, days_ago != 1, now - days_ago * 86400)
+    for days_ago in (30, 29):
+        _store(2, questions[days_ago % 6], True, now - days_ago * 86400)
+
+    stats = db.get_user_stats(1)
+    assert (stats['total_attempts'], stats['correct_answers'], stats['streak'], stats['longest_streak']) == (9, 6, 3, 3)
+    assert stats['answered_questions'] == 3
+    assert [row['attempts'] for row in stats['daily_progress']] == [3, 3, 3]
+    assert len(db.get_user_activity_calendar(1, days=2)) == 2
+    # A run that ended weeks ago is no longer current
+    stats = db.get_user_stats(2)
+    assert (stats['streak'], stats['longest_streak']) == (0, 2)
+    _assert_aggregates_match_rebuild()
+
+    # Deleting a question takes its attempts out of every aggregate
+    db.delete_question(questions[0])
+    assert db.get_user_stats(1)['total_attempts'] == 6
+    assert db.count_answered_questions(1) == 2
+    _assert_aggregates_match_rebuild()
+
+def test_reimport_skips_duplicate_questions(fresh_db):
+    questions = [
+        {'question_type': 'true_false', 'content': f"导入题目 {number}", 'answer': "对", 'category': '导入'}
+        for number in range(20)
+    ]
+    first = db.bulk_import_questions(questions)
+    assert (first['imported'], first['skipped']) == (20, 0)
+    # Case, width and whitespace differences do not make a new question
+    variants = [dict(question, content=f"  导入题目　{number} ") for number, question in enumerate(questions)]
+    second = db.bulk_import_questions(questions + variants)
+    assert (second['imported'], second['skipped']) == (0, 40)
+    assert db.count_questions() == 20
+
+def test_migration_merges_duplicate_questions(baseline_db):
+    # A copy of an existing question, differing only in whitespace, with an attempt on it
+    with sqlite3.connect(baseline_db) as conn:
+        kept, user_id = conn.execute("SELECT question_id, user_id FROM user_progress ORDER BY id LIMIT 1").fetchone()
+        duplicate = conn.execute("""
+            INSERT INTO questions (question_type, content, options, answer, explanation, difficulty, category)
+            SELECT question_type, '  ' || content || '  ', options, answer, explanation, difficulty, category
+            FROM questions WHERE id = ?
+        """, (kept,)).lastrowid
+        conn.execute("INSERT INTO user_progress (user_id, question_id, is_correct, user_answer) VALUES (?, ?, 1, 'x')",
+                     (user_id, duplicate))
+        attempts = conn.execute("SELECT COUNT(*) FROM user_progress WHERE user_id = ?", (user_id,)).fetchone()[0]
+    db.init_db()
+
+    assert db.get_question_by_id(duplicate) is None
+    assert db.get_question_by_id(kept) is not None
+    with db.db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM user_progress WHERE question_id = ?", (duplicate,)).fetchone()[0] == 0
+    assert db.get_user_stats(user_id)['total_attempts'] == attempts
+    _assert_aggregates_match_rebuild()
+
+def test_archive_view_keeps_full_history(fresh_db):
+    questions = _make_questions(4)
+    now = db._utc_day_number() * 86400 + 3600
+    for number, question_id in enumerate(questions):
+        _store(1, question_id, number % 2, now - 90 * 86400)
+    db.record_attempt(1, questions[0], True, "对", wait=True)
+    before = _aggregates()
+
+    assert db.archive_attempts(horizon_days=30) == 4
+    status = db.get_archive_status()
+    assert (status['user_progress']['rows'], status['user_progress_archive']['rows']) == (1, 4)
+    assert len(db.get_user_progress(1)) == 1
+    # Recent activity tops up from the archive, newest first
+    recent = db.get_user_progress(1, include_archive=True, limit=3)
+    assert len(recent) == 3 and recent[0]['attempt_time'] > recent[1]['attempt_time']
+    assert len(db.get_user_progress(1, include_archive=True)) == 5
+    assert sum(1 for _ in db.iter_user_attempts(1)) == 5
+    assert _aggregates() == before
+
+    # An archived question answered again is not counted twice
+    db.record_attempt(1, questions[1], True, "对", wait=True)
+    assert db.count_answered_questions(1) == 4
+    _assert_aggregates_match_rebuild()
+
+def test_mistake_ledger_tracks_wrong_and_resolved(fresh_db):
+    first, second, third = _make_questions(3)
+    for question_id, is_correct, answer in ((first, False, "错1"), (first, False, "错2"), (first, True, "对"),
+                                            (second, False, "错"), (third, True, "对")):
+        db.record_attempt(1, question_id, is_correct, answer)
+
+    ledger = {row['id']: row for row in db.get_user_wrong_questions(1)}
+    assert set(ledger) == {first, second}
+    assert (ledger[first]['wrong_count'], ledger[first]['resolved'], ledger[first]['user_answer']) == (2, 1, "错2")
+    assert (ledger[second]['wrong_count'], ledger[second]['resolved']) == (1, 0)
+    assert db.count_user_wrong_questions(1) == 2
+    assert db.count_user_wrong_questions(1, include_resolved=False) == 1
+
+    # Getting it wrong again reopens the question
+    db.record_attempt(1, first, False, "错3")
+    assert db.count_user_wrong_questions(1, include_resolved=False) == 2
+    _assert_aggregates_match_rebuild()
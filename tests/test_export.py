@@ -0,0 +1,43 @@
+import os
+import sys
+import csv
+import io
+import json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+from utils import export
+
+@pytest.fixture
+def user_with_attempts(tmp_path):
+    db.configure_database(str(tmp_path / 'export.db'))
+    db.init_db()
+    db.create_user('export_user', 'pw')
+    user_id = db.verify_user('export_user', 'pw')['id']
+    db.add_question('true_false', "导出测试题目", "对", 1, '测试')
+    question = db.get_all_questions()[0]
+    db.record_attempt(user_id, question['id'], True, "对")
+    db.record_attempt(user_id, question['id'], False, "错", wait=True)
+    yield user_id
+    db.close_database()
+
+@pytest.mark.parametrize('fmt', list(export.EXPORT_FORMATS))
+def test_user_export_renders_as_download(user_with_attempts, fmt):
+    # The same marshalling st.download_button applies to its data argument
+    from streamlit.elements.widgets.button import marshall_file
+    from streamlit.proto.DownloadButton_pb2 import DownloadButton
+
+    data = export.write_user_export(user_with_attempts, fmt)
+    marshall_file("export", data, DownloadButton(), export.EXPORT_FORMATS[fmt]['mime'], f"export.{fmt}")
+
+    text = data.decode('utf-8')
+    if fmt == 'csv':
+        rows = list(csv.reader(io.StringIO(text)))
+        assert rows[0] == [header for header, _ in export.USER_EXPORT_COLUMNS]
+        assert len(rows) == 3
+    else:
+        rows = [json.loads(line) for line in text.splitlines()]
+        assert len(rows) == 2
+        assert {row["是否正确"] for row in rows} == {"是", "否"}
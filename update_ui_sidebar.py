@@ -29,6 +29,7 @@ from streamlit_option_menu import option_menu
 import database as db
 import auth
 from utils.ui import set_page_config, apply_custom_css, header
+from utils import query_stats
 
 # Import pages
 from pages.practice import practice_page
@@ -42,6 +43,9 @@ from pages.admin_user import admin_user_page
 set_page_config()
 apply_custom_css()
 
+# Create tables and apply pending schema migrations (once per process)
+db.ensure_schema()
+
 # Initialize authentication
 auth.init_auth()
 
@@ -215,19 +219,20 @@ def main():
         # Update page state to selected menu item
         auth.update_page_state(selected)
         
-        # Display page content in main area
-        if selected == "刷题中心":
-            practice_page()
-        elif selected == "错题概览":
-            wrong_questions_page()
-        elif selected == "学习数据":
-            dashboard_page()
-        elif selected == "个人中心":
-            profile_page()
-        elif selected == "题库管理" and auth.is_admin():
-            admin_question_page()
-        elif selected == "用户管理" and auth.is_admin():
-            admin_user_page()
+        # Display page content in main area; its SQL is attributed to the page
+        with query_stats.page(selected):
+            if selected == "刷题中心":
+                practice_page()
+            elif selected == "错题概览":
+                wrong_questions_page()
+            elif selected == "学习数据":
+                dashboard_page()
+            elif selected == "个人中心":
+                profile_page()
+            elif selected == "题库管理" and auth.is_admin():
+                admin_question_page()
+            elif selected == "用户管理" and auth.is_admin():
+                admin_user_page()
 
 if __name__ == "__main__":
     main()""")
@@ -0,0 +1,238 @@
+import os
+import io
+import csv
+import json
+import time
+import shutil
+from contextlib import contextmanager
+from urllib.parse import quote
+import database as db
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# pyarrow is only needed for the analytics export; the app runs without it
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+PARQUET_EXPORT_DIR = os.environ.get('EXAM_EXPORT_DIR', os.path.join('data', 'exports', 'attempts'))
+EXPORT_STATE_FILE = '_export_state.json'
+# Held for the whole run so concurrent exports into one directory take turns
+EXPORT_LOCK_FILE = '_export.lock'
+
+# Per-user downloads (profile page and admin user detail)
+USER_EXPORT_COLUMNS = [
+    ("题目ID", lambda p: p['id']),
+    ("题目内容", lambda p: p['content']),
+    ("类别", lambda p: p['category']),
+    ("难度", lambda p: p['difficulty']),
+    ("提交答案", lambda p: p['user_answer']),
+    ("是否正确", lambda p: "是" if p['is_correct'] else "否"),
+    ("提交时间", lambda p: p['attempt_time']),
+]
+EXPORT_FORMATS = {
+    'csv': {'mime': 'text/csv', 'label': "CSV"},
+    'jsonl': {'mime': 'application/x-ndjson', 'label': "JSON Lines"},
+}
+
+def iter_user_export_rows(user_id):
+    """User attempts as ordered lists of USER_EXPORT_COLUMNS values, streamed from the database."""
+    for attempt in db.iter_user_attempts(user_id):
+        yield [value(attempt) for _, value in USER_EXPORT_COLUMNS]
+
+def write_user_export(user_id, fmt='csv'):
+    """Write a user's full attempt history as CSV or JSONL, row by row, and
+    return the UTF-8 bytes.
+
+    st.download_button reads whatever it is given into bytes and only accepts
+    str, bytes or a few io types, so the file is built in a BytesIO.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    headers = [header for header, _ in USER_EXPORT_COLUMNS]
+    if fmt == 'csv':
+        writer = csv.writer(text)
+        writer.writerow(headers)
+        for row in iter_user_export_rows(user_id):
+            writer.writerow(row)
+    else:
+        for row in iter_user_export_rows(user_id):
+            text.write(json.dumps(dict(zip(headers, row)), ensure_ascii=False) + '\n')
+    text.flush()
+    # Detach so the wrapper does not close the buffer when it is collected
+    text.detach()
+    return buffer.getvalue()
+
+def parquet_available():
+    return pa is not None
+
+def _attempt_schema():
+    return pa.schema([
+        ('attempt_id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('question_id', pa.int64()),
+        ('is_correct', pa.bool_()),
+        ('user_answer', pa.string()),
+        ('attempt_time', pa.timestamp('s')),
+        ('category', pa.string()),
+        ('difficulty', pa.int8()),
+        ('question_type', pa.string()),
+    ])
+
+def load_export_state(out_dir=PARQUET_EXPORT_DIR):
+    """Progress of the incremental export: {"last_ids", "rows", "exported_at"},
+    where last_ids holds the last exported attempt id of each shard."""
+    path = os.path.join(out_dir, EXPORT_STATE_FILE)
+    state = {"last_ids": [], "rows": 0, "exported_at": None}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            state.update(json.load(f))
+    # State files written before sharding carry a single last_id
+    if not state["last_ids"] and state.get("last_id"):
+        state["last_ids"] = [state["last_id"]]
+    state.pop("last_id", None)
+    shards = db.shard_count()
+    state["last_ids"] = (state["last_ids"] + [0] * shards)[:shards]
+    return state
+
+def _save_export_state(out_dir, state):
+    path = os.path.join(out_dir, EXPORT_STATE_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _export_lock(out_dir):
+    """Exclusive lock on out_dir; waits while another export holds it."""
+    with open(os.path.join(out_dir, EXPORT_LOCK_FILE), 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _partition_dir(out_dir, month, category):
+    # Hive-style directories; the category is URI-encoded as pyarrow expects
+    return os.path.join(out_dir, f"month={month}", f"category={quote(category, safe='')}")
+
+def _batch_columns(rows):
+    columns = {name: [] for name in _attempt_schema().names}
+    for row in rows:
+        for name in columns:
+            # The timestamp column comes from the integer UTC epoch, no text parsing
+            columns[name].append(row['attempt_ts' if name == 'attempt_time' else name])
+    columns['is_correct'] = [bool(value) for value in columns['is_correct']]
+    return columns
+
+def export_attempts_parquet(out_dir=PARQUET_EXPORT_DIR, full=False, batch_size=db.EXPORT_BATCH_SIZE):
+    """Export attempts joined with question metadata to Parquet partitioned by
+    month and category, resuming after the last exported attempt id.
+
+    Rows are read and written one batch at a time, with one open ParquetWriter
+    per partition touched by this run, so memory is bounded by batch_size.
+    Each file is named part-<first attempt id in it>.parquet; the state file
+    is only advanced after every writer has closed, so a failed run is simply
+    redone.
+    Shards are exported one after another, each resuming from its own last id.
+    Runs into the same out_dir are serialized by a lock file.
+    Returns {"rows", "files", "last_id", "seconds"}; last_id is the highest
+    attempt id exported so far.
+    """
+    if pa is None:
+        raise RuntimeError("导出 Parquet 需要安装 pyarrow")
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    with _export_lock(out_dir):
+        return _export_attempts_parquet(out_dir, full, batch_size, started)
+
+def _export_attempts_parquet(out_dir, full, batch_size, started):
+    if full:
+        # Start over: earlier partitions would otherwise be duplicated
+        for name in os.listdir(out_dir):
+            if name.startswith('month='):
+                shutil.rmtree(os.path.join(out_dir, name))
+        state = {"last_ids": [0] * db.shard_count(), "rows": 0, "exported_at": None}
+    else:
+        state = load_export_state(out_dir)
+    last_ids = list(state["last_ids"])
+    schema = _attempt_schema()
+    writers = {}
+    files = 0
+    exported = 0
+
+    try:
+        for shard, after_id in enumerate(state["last_ids"]):
+            for rows in db.iter_attempt_history(after_id=after_id, batch_size=batch_size, shard=shard):
+                partitions = {}
+                for row in rows:
+                    month = (row['attempt_time'] or '')[:7] or 'unknown'
+                    partitions.setdefault((month, row['category']), []).append(row)
+                for (month, category), partition_rows in partitions.items():
+                    writer = writers.get((month, category))
+                    if writer is None:
+                        directory = _partition_dir(out_dir, month, category)
+                        os.makedirs(directory, exist_ok=True)
+                        # Attempt ids are unique across shards, so the first id never collides
+                        path = os.path.join(directory, f"part-{partition_rows[0]['attempt_id']:012d}.parquet")
+                        writer = writers[(month, category)] = pq.ParquetWriter(path, schema)
+                        files += 1
+                    writer.write_table(pa.table(_batch_columns(partition_rows), schema=schema))
+                last_ids[shard] = max(last_ids[shard], max(row['attempt_id'] for row in rows))
+                exported += len(rows)
+            # Close this shard's files before moving on to the next shard
+            for writer in writers.values():
+                writer.close()
+            writers = {}
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    # A full run always rewrites the state, even with nothing to export, so
+    # no progress from before the wipe survives
+    if exported or full:
+        _save_export_state(out_dir, {
+            "last_ids": last_ids,
+            "rows": state["rows"] + exported,
+            "exported_at": time.strftime('%Y-%m-%d %H:%M:%S')
+        })
+    return {
+        "rows": exported,
+        "files": files,
+        "last_id": max(last_ids, default=0),
+        "seconds": time.perf_counter() - started
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="导出答题记录为按月份和类别分区的 Parquet 文件")
+    parser.add_argument("--out-dir", default=PARQUET_EXPORT_DIR, help="导出目录")
+    parser.add_argument("--full", action="store_true", help="忽略上次进度，从头导出")
+    parser.add_argument("--batch-size", type=int, default=db.EXPORT_BATCH_SIZE, help="每批读取的记录数")
+    args = parser.parse_args()
+
+    db.ensure_schema()
+    report = export_attempts_parquet(args.out_dir, full=args.full, batch_size=args.batch_size)
+    print(f"已导出 {report['rows']} 条记录到 {report['files']} 个文件，"
+          f"最新记录 ID {report['last_id']}，耗时 {report['seconds']:.1f} 秒")
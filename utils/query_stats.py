@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Statement tracing for pooled connections: every statement's latency, row
+# count, calling function and page are recorded; slow ones are logged with
+# their query plan. Off by default; EXAM_SQL_TRACE=1 turns it on.
+TRACE_ENABLED = os.environ.get('EXAM_SQL_TRACE', '0') != '0'
+SLOW_QUERY_MS = float(os.environ.get('EXAM_SLOW_QUERY_MS', '100'))
+# Optional JSON Lines file receiving every slow query as well
+SLOW_QUERY_LOG = os.environ.get('EXAM_SLOW_QUERY_LOG')
+SLOW_QUERY_KEEP = 200
+# Latency samples kept per function/page for the percentiles
+SAMPLE_SIZE = 1000
+PLAN_CACHE_SIZE = 500
+PERCENTILES = (50, 95, 99)
+# Statements that take the database write lock when no transaction is open
+# (DML opens one implicitly); their latency is the best view of lock waits
+LOCK_PREFIXES = ('BEGIN IMMEDIATE', 'BEGIN EXCLUSIVE', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+# Statements that have no useful plan
+UNPLANNED_PREFIXES = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE',
+                      'CREATE', 'DROP', 'ALTER', 'ATTACH', 'DETACH', 'ANALYZE', 'VACUUM', 'EXPLAIN')
+
+_current_page = contextvars.ContextVar('query_page', default=None)
+_lock = threading.Lock()
+# Serializes appends to SLOW_QUERY_LOG without holding _lock during file I/O
+_log_lock = threading.Lock()
+_by_function = {}
+_by_page = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_KEEP)
+_plans = {}
+
+class _Series:
+    """Running totals plus a bounded window of latency samples."""
+
+    __slots__ = ('calls', 'rows', 'total_ms', 'max_ms', 'samples')
+
+    def __init__(self):
+        self.calls = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, elapsed_ms, rows):
+        self.calls += 1
+        self.rows += rows
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.samples.append(elapsed_ms)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        result = {
+            "calls": self.calls,
+            "rows": self.rows,
+            "total_ms": self.total_ms,
+            "mean_ms": self.total_ms / self.calls if self.calls else 0.0,
+            "max_ms": self.max_ms,
+        }
+        for p in PERCENTILES:
+            # Nearest-rank percentile over the sample window
+            result[f"p{p}_ms"] = ordered[max(0, -(-len(ordered) * p // 100) - 1)] if ordered else 0.0
+        return result
+
+_lock_waits = _Series()
+
+@contextmanager
+def page(name):
+    """Attribute the statements run inside the block to page ``name``."""
+    token = _current_page.set(name)
+    try:
+        yield
+    finally:
+        _current_page.reset(token)
+
+def _caller():
+    # Nearest frame outside this module and the stdlib plumbing between it and the caller
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module != __name__ and module != 'contextlib':
+            return f"{module}.{getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)}"
+        frame = frame.f_back
+    return '?'
+
+def _query_plan(conn, sql, params, explain=True):
+    if sql in _plans:
+        return _plans[sql]
+    if not explain or sql.lstrip().upper().startswith(UNPLANNED_PREFIXES):
+        return None
+    try:
+        # A plain cursor, so the EXPLAIN itself is not traced
+        rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error:
+        return None
+    plan = [row[3] for row in rows]
+    with _lock:
+        if len(_plans) >= PLAN_CACHE_SIZE:
+            _plans.clear()
+        _plans[sql] = plan
+    return plan
+
+def _record(conn, sql, params, elapsed_ms, rows, function, page_name, takes_lock=False, explain=True):
+    with _lock:
+        _by_function.setdefault(function, _Series()).add(elapsed_ms, rows)
+        _by_page.setdefault(page_name or '-', _Series()).add(elapsed_ms, rows)
+        if takes_lock:
+            _lock_waits.add(elapsed_ms, 0)
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+    entry = {
+        "time": time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+        "ms": round(elapsed_ms, 2),
+        "rows": rows,
+        "function": function,
+        "page": page_name,
+        "sql": ' '.join(sql.split()),
+        "plan": _query_plan(conn, sql, params, explain),
+    }
+    with _lock:
+        _slow_queries.append(entry)
+    if SLOW_QUERY_LOG:
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with _log_lock:
+            with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that times each statement from execute() until its rows are
+    consumed (or the cursor is dropped) and then records it."""
+
+    _pending = None
+
+    def _start(self, sql, params):
+        self._finish()
+        takes_lock = not self.connection.in_transaction and sql.lstrip().upper().startswith(LOCK_PREFIXES)
+        # [sql, params, started, elapsed seconds so far, rows, function, page, takes lock]
+        self._pending = [sql, params, time.perf_counter(), 0.0, 0, _caller(), _current_page.get(), takes_lock]
+
+    def _finish(self, explain=True):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, params, _, elapsed, rows, function, page_name, takes_lock = pending
+        if rows == 0 and self.rowcount > 0:
+            rows = self.rowcount
+        _record(self.connection, sql, params, elapsed * 1000, rows, function, page_name, takes_lock, explain)
+
+    def _timed(self, method, *args):
+        pending = self._pending
+        if pending is None:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except BaseException:
+            # A failed statement is not recorded
+            self._pending = None
+            raise
+        finally:
+            pending[3] += time.perf_counter() - started
+
+    def execute(self, sql, params=()):
+        self._start(sql, params)
+        self._timed(super().execute, sql, params)
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._start(sql, seq_of_params[0] if seq_of_params else ())
+        self._timed(super().executemany, sql, seq_of_params)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if self._pending is not None:
+            if row is None:
+                self._finish()
+            else:
+                self._pending[4] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if self._pending is not None:
+            self._pending[4] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending[4] += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Garbage collection can run on any thread at any point, so no EXPLAIN
+        # here: a slow statement only gets a plan if one is already cached
+        try:
+            self._finish(explain=False)
+        except Exception:
+            pass
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose statements all run through TracedCursor."""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+def connection_factory():
+    """Factory to pass to sqlite3.connect(): traced unless tracing is disabled."""
+    return TracedConnection if TRACE_ENABLED else sqlite3.Connection
+
+def get_function_stats():
+    """{function: {"calls", "rows", "total_ms", "mean_ms", "max_ms", "p50_ms", ...}}, slowest total first."""
+    with _lock:
+        stats = {name: series.summary() for name, series in _by_function.items()}
+    return dict(sorted(stats.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+
+def get_page_stats():
+    """Same figures per page ("-" for statements outside any page)."""
+    with _lock:
+        stats = {name: series.summary() for name, series in _by_page.items()}
+    return dict(sorted(stats.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+
+def get_lock_wait_stats():
+    """Latency of the statements that took the write lock: BEGIN IMMEDIATE/EXCLUSIVE,
+    or the first write outside a transaction."""
+    with _lock:
+        return _lock_waits.summary()
+
+def get_slow_queries():
+    """Most recent slow statements, newest first."""
+    with _lock:
+        return list(reversed(_slow_queries))
+
+def reset():
+    global _lock_waits
+    with _lock:
+        _by_function.clear()
+        _by_page.clear()
+        _slow_queries.clear()
+        _plans.clear()
+        _lock_waits = _Series()
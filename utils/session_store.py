@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import database as db
+
+# Server-side login sessions keyed by a per-browser token. Reads are served
+# from an in-memory dict; changed sessions are written to the sessions table
+# by a background thread, coalesced per token, so saving the same state again
+# costs nothing and a page switch never waits on the disk.
+SESSION_TTL = int(os.environ.get('EXAM_SESSION_TTL', str(7 * 86400)))
+# Sessions idle this long drop out of memory; the table still has them
+CACHE_TTL = 1800
+FLUSH_INTERVAL = 1.0
+# A sliding expiry is only written back once it has moved this far
+TOUCH_INTERVAL = 3600
+PURGE_INTERVAL = 3600
+
+class _Entry:
+    __slots__ = ('data', 'expires_at', 'last_used', 'saved_expires_at')
+
+    def __init__(self, data, expires_at, saved_expires_at=0):
+        self.data = data
+        self.expires_at = expires_at
+        self.last_used = time.time()
+        self.saved_expires_at = saved_expires_at
+
+class SessionStore:
+    """Token -> session dict with a TTL, persisted write-behind.
+
+    get() falls back to the table for tokens not in memory (another process
+    or an evicted entry); put() and delete() only mark the token dirty and
+    the flush thread writes the latest state of each dirty token in one
+    transaction.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, cache_ttl=CACHE_TTL, flush_interval=FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._entries = {}
+        # Tokens whose saved row is stale; a dirty token without an entry is deleted
+        self._dirty = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_purge = 0.0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+                    self._thread.start()
+
+    def _touch(self, token, entry, now):
+        entry.last_used = now
+        entry.expires_at = int(now) + self.ttl
+        if entry.expires_at - entry.saved_expires_at >= TOUCH_INTERVAL:
+            self._dirty.add(token)
+
+    def get(self, token):
+        """Copy of the session for token, or None if it is unknown or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+        if entry is None:
+            try:
+                row = db.load_session(token, int(now))
+            except sqlite3.Error as e:
+                print(f"读取会话失败: {e}")
+                return None
+            if row is None:
+                return None
+            with self._lock:
+                entry = self._entries.setdefault(
+                    token, _Entry(json.loads(row['data']), row['expires_at'], row['expires_at'])
+                )
+        with self._lock:
+            if entry.expires_at <= now:
+                self._entries.pop(token, None)
+                self._dirty.add(token)
+                return None
+            self._touch(token, entry, now)
+            data = dict(entry.data)
+        self._ensure_started()
+        return data
+
+    def put(self, token, data):
+        """Save data for token; a no-op apart from the expiry when nothing changed."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                entry = self._entries[token] = _Entry(None, 0)
+            if entry.data != data:
+                entry.data = dict(data)
+                self._dirty.add(token)
+            self._touch(token, entry, now)
+        self._ensure_started()
+
+    def delete(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+            self._dirty.add(token)
+        self._ensure_started()
+
+    def drop_user(self, user_id):
+        """Forget every session of user_id, so the flush deletes their rows
+        instead of writing them back."""
+        with self._lock:
+            tokens = [token for token, entry in self._entries.items()
+                      if entry.data and entry.data.get('user_id') == user_id]
+            for token in tokens:
+                del self._entries[token]
+            self._dirty.update(tokens)
+        if tokens:
+            self._ensure_started()
+        return len(tokens)
+
+    def flush(self):
+        """Write every dirty session now; returns the number of tokens written."""
+        with self._flush_lock:
+            with self._lock:
+                tokens, self._dirty = self._dirty, set()
+                rows, deleted, saved = [], [], []
+                for token in tokens:
+                    entry = self._entries.get(token)
+                    if entry is None:
+                        deleted.append(token)
+                    else:
+                        rows.append((token, entry.data.get('user_id'), json.dumps(entry.data, ensure_ascii=False),
+                                     entry.expires_at))
+                        saved.append((entry, entry.expires_at))
+            if not tokens:
+                return 0
+            try:
+                if rows:
+                    db.save_sessions(rows)
+                if deleted:
+                    db.delete_sessions(deleted)
+            except sqlite3.Error as e:
+                # Keep them dirty and retry on the next round
+                print(f"保存会话失败: {e}")
+                with self._lock:
+                    self._dirty |= tokens
+                return 0
+            with self._lock:
+                for entry, expires_at in saved:
+                    entry.saved_expires_at = expires_at
+            return len(tokens)
+
+    def _evict(self, now):
+        with self._lock:
+            for token, entry in list(self._entries.items()):
+                if entry.expires_at <= now:
+                    del self._entries[token]
+                    self._dirty.add(token)
+                elif entry.last_used + self.cache_ttl <= now and token not in self._dirty:
+                    del self._entries[token]
+        if now - self._last_purge >= PURGE_INTERVAL:
+            self._last_purge = now
+            try:
+                db.purge_expired_sessions(int(now))
+            except sqlite3.Error as e:
+                print(f"清理过期会话失败: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            self._evict(time.time())
+
+    def close(self, timeout=10):
+        """Stop the flush thread and write what is still pending."""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
@@ -3,6 +3,7 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
+from utils import export
 
 # UI Theme and Style
 def set_page_config():
@@ -285,4 +286,57 @@ def pagination_nav(total_items, page_size, page_key="page"):
     with col2:
         st.write(f"页面 {st.session_state[page_key] + 1}/{num_pages}")
     
-    return st.session_state[page_key] 
\ No newline at end of file
+    return st.session_state[page_key]
+
+def keyset_pagination_nav(total_items, page_size, page_key, filter_key=None):
+    """Prev/next controls for cursor-paginated lists.
+    
+    Returns the pagination state; load the page with state['cursors'][-1]
+    and store the page's next cursor in state['next_cursor']. The state resets
+    whenever filter_key changes.
+    """
+    state = st.session_state.get(page_key)
+    if state is None or state['filter_key'] != filter_key:
+        state = {'filter_key': filter_key, 'cursors': [None], 'next_cursor': None}
+        st.session_state[page_key] = state
+    
+    num_pages = (total_items + page_size - 1) // page_size
+    if num_pages <= 1:
+        return state
+    
+    col1, col2, col3, col4 = st.columns([1, 3, 3, 1])
+    
+    with col1:
+        if st.button("◀", key=f"prev_{page_key}") and len(state['cursors']) > 1:
+            state['cursors'].pop()
+    
+    with col4:
+        if st.button("▶", key=f"next_{page_key}") and state['next_cursor'] is not None:
+            state['cursors'].append(state['next_cursor'])
+    
+    with col2:
+        st.write(f"页面 {len(state['cursors'])}/{num_pages}")
+    
+    return state
+
+def user_data_export(user_id, file_stem, key, button_label="导出数据"):
+    """Format picker plus download button for a user's full attempt history.
+
+    The file is written row by row by utils.export instead of being built as
+    a DataFrame, so heavy users don't multiply their history in memory.
+    """
+    fmt = st.selectbox(
+        "导出格式",
+        list(export.EXPORT_FORMATS),
+        format_func=lambda f: export.EXPORT_FORMATS[f]['label'],
+        key=f"{key}_format"
+    )
+    if st.button(button_label, key=f"{key}_button"):
+        label = export.EXPORT_FORMATS[fmt]['label']
+        st.download_button(
+            label=f"下载{label}文件",
+            data=export.write_user_export(user_id, fmt),
+            file_name=f"{file_stem}.{fmt}",
+            mime=export.EXPORT_FORMATS[fmt]['mime'],
+            key=f"{key}_download"
+        )